@@ -1,11 +1,151 @@
 #!/usr/bin/env python3
 import sys
+import time
+import json
+import argparse
+import contextlib
+
+# Heavy dependencies (Google, Airtable, tqdm) are only imported once an
+# operation that needs them is chosen; keep this module's imports to the stdlib.
+
+DUP_POLICY_CHOICES = ['replace', 'skip', 'keep-both', 'skip-account', 'prompt']
+SHARD_STRATEGY_CHOICES = ['round-robin', 'hash', 'weighted']
+# Values of the scheduler options (see schedule_options_parser) when they are not given
+SCHEDULE_OPTION_DEFAULTS = {'cache_max_gb': None, 'refresh': False, 'caption_index': False}
+
+def split_list(value):
+    """'all' stays 'all'; 'a,b , c' becomes ['a', 'b', 'c']."""
+    if value.strip().lower() == 'all':
+        return 'all'
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def schedule_options_parser():
+    """
+    Options of the content scheduler, shared by the top-level parser (for the
+    interactive menu) and the schedule subcommand. Unset options are left out
+    of the namespace, so a value given before the subcommand is not reset by
+    the subcommand's defaults; parse_args fills in SCHEDULE_OPTION_DEFAULTS.
+    """
+    options = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    options.add_argument(
+        '--cache-max-gb', type=float,
+        help="Size limit of the shared media cache used when scheduling content, not counting media still "
+             "linked from account folders (0 disables it)"
+    )
+    options.add_argument(
+        '--refresh', action='store_true',
+        help="Fetch the Active Accounts lists from Airtable instead of using the cached copies"
+    )
+    options.add_argument(
+        '--caption-index', action='store_true',
+        help="Detect duplicate captions through the cached caption index (ignores case and whitespace)"
+    )
+    return options
+
+def parse_args(argv=None):
+    schedule_options = schedule_options_parser()
+    parser = argparse.ArgumentParser(
+        description="Onimator Plugin CLI Tool. Run without a command for the interactive menu.",
+        parents=[schedule_options]
+    )
+    parser.add_argument(
+        '--profile-imports', action='store_true',
+        help="Report the import time of each module when the tool exits"
+    )
+    subparsers = parser.add_subparsers(dest='command')
+
+    update = subparsers.add_parser('update-sources', help="Push a usernames file into device target files")
+    update.add_argument('--device', required=True, type=split_list,
+                        help="'all' or a comma-separated list of device folders")
+    update.add_argument('--accounts', type=split_list, default='all',
+                        help="'all' or a comma-separated list of account folders")
+    update.add_argument('--target', default='like-source-followers.txt', help="Target file in each account folder")
+    update.add_argument('--source', default=None,
+                        help="Usernames file (default: follow_sources.txt, or exclude_names.txt for name filters)")
+    update.add_argument('--parallel', type=int, default=8, help="Number of target files to write at once")
+    update.add_argument('--backup', action='store_true', help="Keep the previous version of each file as <file>.bak")
+    update.add_argument('--shard', choices=SHARD_STRATEGY_CHOICES, default=None,
+                        help="Split the usernames across the selected accounts instead of giving each the full list")
+    update.add_argument('--shard-k', type=int, default=1,
+                        help="With --shard, the maximum number of accounts each username is given to (default: 1)")
+    update.add_argument('--exclude', action='store_true',
+                        help="Skip usernames containing any entry of exclude_names.txt")
+    update.add_argument('--json', action='store_true', help="Print the result as JSON on stdout")
+
+    schedule = subparsers.add_parser(
+        'schedule', help="Schedule Airtable content onto device accounts", parents=[schedule_options]
+    )
+    schedule.add_argument('--model', required=True, help="Model name from config.json")
+    schedule.add_argument('--devices', type=split_list, default='all',
+                          help="'all' or a comma-separated list of device folders")
+    schedule.add_argument('--accounts', type=split_list, default='all',
+                          help="'all' or a comma-separated list of usernames")
+    schedule.add_argument('--dup-policy', choices=DUP_POLICY_CHOICES, default='skip',
+                          help="What to do with duplicate captions (default: skip)")
+    schedule.add_argument('--dup-within-days', type=int, default=None,
+                          help="Only treat a caption as a duplicate if the existing post is scheduled within this many days")
+    schedule.add_argument('--dup-match-hash', action='store_true',
+                          help="Only treat a caption as a duplicate if both posts use identical media files")
+    schedule.add_argument('--parallel', type=int, default=1, help="Number of devices to schedule at once")
+    schedule.add_argument('--json', action='store_true', help="Print the result as JSON on stdout")
+    args = parser.parse_args(argv)
+    for name, default in SCHEDULE_OPTION_DEFAULTS.items():
+        if not hasattr(args, name):
+            setattr(args, name, default)
+    return args
+
+def run_command(args):
+    """Run a batch subcommand and return (result, exit_code)."""
+    if args.command == 'update-sources':
+        from update_sources.update_targets import run_update
+        result = run_update(
+            args.device, args.accounts, target_file=args.target, source=args.source, max_workers=args.parallel,
+            keep_backup=args.backup, shard_strategy=args.shard, shard_k=args.shard_k,
+            exclude=args.exclude
+        )
+        ok = not result['errors'] and all(not device['failed'] for device in result['devices'])
+        return result, 0 if ok else 1
+
+    from content_scheduler.post_inserter import schedule_batch
+    kwargs = {'refresh': args.refresh, 'use_caption_index': args.caption_index}
+    if args.cache_max_gb is not None:
+        kwargs['cache_max_gb'] = args.cache_max_gb
+    result = schedule_batch(
+        args.model,
+        devices=args.devices,
+        accounts=args.accounts,
+        dup_action=args.dup_policy,
+        dup_within_days=args.dup_within_days,
+        dup_match_hash=args.dup_match_hash,
+        parallel=args.parallel,
+        **kwargs
+    )
+    ok = not result['errors'] and all(not device['failed'] for device in result['devices'])
+    return result, 0 if ok else 1
 
 def main():
+    started = time.perf_counter()
+    args = parse_args()
+    if args.profile_imports:
+        from common.import_profile import profile_imports
+        profile_imports()
+
+    if args.command:
+        if args.json:
+            # Keep stdout clean for the JSON document; progress goes to stderr
+            with contextlib.redirect_stdout(sys.stderr):
+                result, exit_code = run_command(args)
+            print(json.dumps(result, indent=2, default=str))
+        else:
+            result, exit_code = run_command(args)
+        sys.exit(exit_code)
+
     print("Welcome to the Onimator Plugin CLI Tool!")
     print("Please choose an operation:")
     print("1. Update Sources")
     print("2. Schedule Content")
+    if args.profile_imports:
+        print(f"(menu ready in {(time.perf_counter() - started) * 1000:.1f} ms)")
     
     choice = input("Enter your choice (1 or 2): ").strip()
     
@@ -14,11 +154,13 @@ def main():
         update_sources_main()
     elif choice == "2":
         from content_scheduler.post_inserter import main as schedule_content_main
-        schedule_content_main()
+        kwargs = {'refresh': args.refresh, 'use_caption_index': args.caption_index}
+        if args.cache_max_gb is not None:
+            kwargs['cache_max_gb'] = args.cache_max_gb
+        schedule_content_main(**kwargs)
     else:
         print("Invalid selection. Exiting.")
         sys.exit(1)
 
 if __name__ == "__main__":
     main()
-
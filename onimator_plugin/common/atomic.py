@@ -0,0 +1,54 @@
+import os
+import stat
+import shutil
+import tempfile
+
+# Read once at import: os.umask() can only be read by setting it, which would
+# briefly apply to files other threads create if done on every write.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def fsync_directory(directory):
+    """Persist a rename inside directory (no-op where directories can't be opened)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_lines(file_path, lines, keep_backup=False):
+    """
+    Replace file_path with the given lines (each written followed by a newline)
+    without readers ever seeing a partial file: the data goes to a temp file in
+    the same directory, is fsync'd, and is os.replace'd over the original.
+    The original's permissions are kept; with keep_backup the previous version
+    is left next to it as <file>.bak.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.writelines(line + '\n' for line in lines)
+            file.flush()
+            os.fsync(file.fileno())
+
+        if os.path.exists(file_path):
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(file_path).st_mode))
+            if keep_backup:
+                shutil.copy2(file_path, f"{file_path}.bak")
+        else:
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_directory(directory)
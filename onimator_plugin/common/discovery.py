@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import atexit
+import hashlib
+import logging
+import threading
+from common.atomic import atomic_write_lines
+from common.paths import cache_path
+
+# Device folders are named after the device ID: capitals and digits, usually 10+ characters
+DEVICE_PATTERN = re.compile(r'^[A-Z0-9]+$')
+MIN_DEVICE_ID_LENGTH = 10
+# Account-folder names that are never accounts; callers may pass their own list
+EXCLUDED_ACCOUNT_FOLDERS = ['.stm', '.trash', 'trash', 'temp', 'temporary']
+# Files remembered per account folder: the post database and the target/source lists
+KNOWN_ACCOUNT_FILES = {'scheduled_post.db'}
+KNOWN_ACCOUNT_FILE_SUFFIXES = ('.txt',)
+
+
+def is_known_account_file(name):
+    return name in KNOWN_ACCOUNT_FILES or name.endswith(KNOWN_ACCOUNT_FILE_SUFFIXES)
+
+
+class DeviceIndex:
+    """
+    Cached listing of an Onimator base folder: devices -> accounts -> known files.
+
+    Each directory is read with a single os.scandir, reusing the DirEntry type
+    information instead of one stat per entry, and remembered with its mtime.
+    Later lookups cost one stat per directory; only directories whose mtime
+    changed (an entry was added, removed or renamed) are listed again. The
+    index is persisted in the plugin cache so this holds across runs too:
+    lookups only mark it dirty, and callers save() it once per operation
+    (the shared indexes are also saved at exit).
+    """
+
+    def __init__(self, base_dir, index_path=None):
+        self.base_dir = base_dir
+        self.index_path = index_path or cache_path(
+            'discovery', hashlib.sha1(base_dir.encode('utf-8')).hexdigest()[:16] + '.json'
+        )
+        self.scans = 0
+        self._dirs = {}
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r') as file:
+                data = json.load(file)
+            if data.get('base_dir') == self.base_dir:
+                self._dirs = {path: (mtime, [tuple(entry) for entry in entries])
+                              for path, (mtime, entries) in data['dirs'].items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable discovery index {self.index_path}: {e}")
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                atomic_write_lines(self.index_path, [json.dumps({'base_dir': self.base_dir, 'dirs': self._dirs})])
+                self._dirty = False
+            except OSError as e:
+                logging.warning(f"Could not save discovery index {self.index_path}: {e}")
+
+    def _entries(self, *parts, keep_file=None):
+        """
+        [(name, is_dir)] of base_dir/parts, or None if it doesn't exist. Files are
+        only kept when keep_file(name) is true.
+        """
+        relative = '/'.join(parts)
+        path = os.path.join(self.base_dir, *parts)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            with self._lock:
+                if self._dirs.pop(relative, None) is not None:
+                    self._dirty = True
+            return None
+        with self._lock:
+            cached = self._dirs.get(relative)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        entries = []
+        try:
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir or (keep_file is not None and keep_file(entry.name)):
+                        entries.append((entry.name, is_dir))
+        except OSError:
+            return None
+        with self._lock:
+            self._dirs[relative] = (mtime, entries)
+            self._dirty = True
+            self.scans += 1
+        return entries
+
+    def devices(self):
+        """Device folders in the base folder, sorted. Raises OSError if the base folder is missing."""
+        entries = self._entries()
+        if entries is None:
+            raise FileNotFoundError(f"Base folder not found: {self.base_dir}")
+        return sorted(
+            name for name, is_dir in entries
+            if is_dir and DEVICE_PATTERN.match(name) and len(name) >= MIN_DEVICE_ID_LENGTH
+        )
+
+    def accounts(self, device, excluded=EXCLUDED_ACCOUNT_FOLDERS):
+        """Account folders of a device (hidden and `excluded` names skipped), or None if it is missing."""
+        entries = self._entries(device)
+        if entries is None:
+            return None
+        excluded = {name.lower() for name in excluded}
+        return [
+            name for name, is_dir in entries
+            if is_dir and not name.startswith('.') and name.lower() not in excluded
+        ]
+
+    def account_files(self, device, account):
+        """Names of the known files (scheduled_post.db, *.txt) in an account folder, or None if it is missing."""
+        entries = self._entries(device, account, keep_file=is_known_account_file)
+        if entries is None:
+            return None
+        return {name for name, is_dir in entries if not is_dir}
+
+    def has_file(self, device, account, name):
+        files = self.account_files(device, account)
+        return files is not None and name in files
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def device_index(base_dir):
+    """The process-wide DeviceIndex for base_dir, saved at exit if it changed."""
+    with _indexes_lock:
+        if base_dir not in _indexes:
+            _indexes[base_dir] = DeviceIndex(base_dir)
+            atexit.register(_indexes[base_dir].save)
+        return _indexes[base_dir]
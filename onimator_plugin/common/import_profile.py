@@ -0,0 +1,75 @@
+import sys
+import time
+import atexit
+import builtins
+import importlib.util
+
+
+class ImportProfiler:
+    """
+    Measure how long each module takes to import by wrapping builtins.__import__.
+    Only imports that actually load something new are recorded; times are
+    inclusive (a module's time contains the modules it imports in turn).
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.total = 0.0
+        self._depth = 0
+        self._original_import = None
+
+    def _resolve(self, name, globals, level):
+        if level and globals:
+            package = globals.get('__package__') or globals.get('__name__', '')
+            try:
+                return importlib.util.resolve_name('.' * level + name, package)
+            except (ImportError, ValueError):
+                return name
+        return name
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        fullname = self._resolve(name, globals, level)
+        targets = [fullname] if fullname not in sys.modules else []
+        for item in fromlist or ():
+            if item != '*' and f"{fullname}.{item}" not in sys.modules:
+                targets.append(f"{fullname}.{item}")
+        if not targets:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            elapsed = time.perf_counter() - start
+            if self._depth == 0:
+                self.total += elapsed
+            for target in targets:
+                if target in sys.modules and target not in self.timings:
+                    self.timings[target] = elapsed
+                    break
+
+    def install(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+        return self
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def report(self, top=25):
+        print("\n⏱️ Import Profile (inclusive times):")
+        for name, elapsed in sorted(self.timings.items(), key=lambda item: item[1], reverse=True)[:top]:
+            print(f"{elapsed * 1000:9.1f} ms  {name}")
+        print(f"→ {len(self.timings)} module(s) imported in {self.total * 1000:.1f} ms")
+
+
+def profile_imports(top=25):
+    """Start profiling imports now and print the report when the process exits."""
+    profiler = ImportProfiler().install()
+    atexit.register(profiler.report, top)
+    return profiler
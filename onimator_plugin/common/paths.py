@@ -0,0 +1,13 @@
+import os
+
+# Root of the onimator_plugin package
+PLUGIN_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Plugin-owned state (indexes, caches, journals). Never written into Onimator's folders.
+CACHE_DIR = os.path.join(PLUGIN_DIR, 'cache')
+
+def cache_path(*parts):
+    """Return a path inside the plugin cache directory, creating its parent folder."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,202 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from common.throttle import RetryStats, call_with_backoff
+
+# How long SQLite itself waits on a lock before reporting SQLITE_BUSY
+BUSY_TIMEOUT_MS = 5000
+# Further attempts (with jittered backoff) once busy_timeout has run out
+LOCK_MAX_RETRIES = 8
+LOCK_BACKOFF_BASE = 0.25
+LOCK_BACKOFF_MAX = 8.0
+
+
+def is_locked_error(error):
+    """True for SQLITE_BUSY / SQLITE_LOCKED ('database is locked', 'database table is locked')."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class _Database:
+    """One reused connection plus its lock and contention statistics."""
+
+    def __init__(self, db_path, busy_timeout_ms):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=busy_timeout_ms / 1000, check_same_thread=False)
+        self.conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        # Read after the first successful statement: reading it may wait on Onimator's lock
+        self.journal_mode = None
+        self.lock = threading.RLock()
+        self.stats = RetryStats()
+        self.lock_wait_seconds = 0.0
+        self.transactions = 0
+
+    def detect_journal_mode(self):
+        """
+        Read (never change: Onimator owns these files) the journal mode. Reading
+        it needs a shared lock, so while the file is locked it stays unknown and
+        is read again after the next successful call. Call with self.lock held.
+        """
+        try:
+            self.journal_mode = self.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        except sqlite3.OperationalError as e:
+            if not is_locked_error(e):
+                raise
+
+
+class SQLitePool:
+    """
+    Connection manager for the SQLite files we touch during a run, keyed by path.
+
+    Each database gets one connection, reused for the whole run and guarded by
+    a per-database lock, with busy_timeout set so short lock conflicts with
+    Onimator are waited out inside SQLite. transaction() takes the write lock
+    up front (BEGIN IMMEDIATE) and, should the database stay locked longer than
+    busy_timeout, rolls back and retries with jittered backoff. Time spent
+    waiting for locks is tracked per database and shown by print_summary().
+    """
+
+    def __init__(
+        self,
+        busy_timeout_ms=BUSY_TIMEOUT_MS,
+        max_retries=LOCK_MAX_RETRIES,
+        backoff_base=LOCK_BACKOFF_BASE,
+        backoff_max=LOCK_BACKOFF_MAX
+    ):
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def _database(self, db_path):
+        key = os.path.abspath(db_path)
+        with self._lock:
+            database = self._databases.get(key)
+        if database is not None:
+            return database
+        # Connect outside the pool lock so one slow file never holds up the others
+        database = _Database(key, self.busy_timeout_ms)
+        with self._lock:
+            existing = self._databases.setdefault(key, database)
+        if existing is not database:
+            database.conn.close()
+        return existing
+
+    def get(self, db_path):
+        """The shared connection for db_path. Callers serialise access through connection()."""
+        return self._database(db_path).conn
+
+    @contextmanager
+    def connection(self, db_path):
+        """Hold db_path's lock and yield its connection."""
+        database = self._database(db_path)
+        with database.lock:
+            yield database.conn
+
+    def retry(self, db_path, fn):
+        """Run fn() (e.g. a read), retrying with backoff while the database is locked."""
+        database = self._database(db_path)
+        with database.lock:
+            result = self._with_backoff(database, fn)
+            if database.journal_mode is None:
+                database.detect_journal_mode()
+            return result
+
+    def transaction(self, db_path, fn):
+        """
+        Run fn(conn) in a write transaction and commit it. On a lock timeout the
+        transaction is rolled back and fn is run again, so fn must only issue
+        SQL. The last error is raised once the retries are used up.
+        """
+        database = self._database(db_path)
+        conn = database.conn
+
+        def attempt():
+            if conn.in_transaction:
+                conn.rollback()
+            started = time.monotonic()
+            conn.execute("BEGIN IMMEDIATE")
+            begin_wait = time.monotonic() - started
+            try:
+                result = fn(conn)
+                started = time.monotonic()
+                conn.commit()
+                database.lock_wait_seconds += begin_wait + time.monotonic() - started
+                return result
+            except BaseException:
+                conn.rollback()
+                raise
+
+        with database.lock:
+            result = self._with_backoff(database, attempt)
+            database.transactions += 1
+            if database.journal_mode is None:
+                database.detect_journal_mode()
+            return result
+
+    def _with_backoff(self, database, fn):
+        def timed():
+            started = time.monotonic()
+            try:
+                return fn()
+            except Exception as e:
+                if is_locked_error(e):
+                    # The whole failed attempt was spent waiting on busy_timeout
+                    database.lock_wait_seconds += time.monotonic() - started
+                raise
+
+        backoff_before = database.stats.backoff_seconds
+        try:
+            return call_with_backoff(
+                timed, is_locked_error,
+                max_retries=self.max_retries, base=self.backoff_base, cap=self.backoff_max,
+                stats=database.stats,
+                on_retry=lambda e: print(f"⏳ {database.db_path} is locked, retrying: {e}")
+            )
+        finally:
+            database.lock_wait_seconds += database.stats.backoff_seconds - backoff_before
+
+    def report(self):
+        """{db_path: {'journal_mode', 'transactions', 'lock_wait_seconds', 'retries', 'gave_up'}}"""
+        with self._lock:
+            databases = list(self._databases.values())
+        return {
+            database.db_path: {
+                'journal_mode': database.journal_mode or 'unknown',
+                'transactions': database.transactions,
+                'lock_wait_seconds': round(database.lock_wait_seconds, 3),
+                'retries': database.stats.retries,
+                'gave_up': database.stats.gave_up,
+            }
+            for database in databases
+        }
+
+    def print_summary(self, min_wait_seconds=0.5):
+        """Print the databases that waited on locks (or were retried) during the run."""
+        contended = {
+            db_path: info for db_path, info in self.report().items()
+            if info['retries'] or info['lock_wait_seconds'] >= min_wait_seconds
+        }
+        if not contended:
+            return
+        print("\n🔒 SQLite Lock Contention:")
+        for db_path, info in contended.items():
+            print(f"→ {db_path} ({info['journal_mode']} journal): waited {info['lock_wait_seconds']:.1f}s, "
+                  f"{info['retries']} retries, {info['gave_up']} gave up")
+
+    def close_all(self):
+        with self._lock:
+            databases, self._databases = list(self._databases.values()), {}
+        for database in databases:
+            with database.lock:
+                database.conn.close()
+
+
+# Shared by everything that writes SQLite files during a run
+sqlite_pool = SQLitePool()
@@ -0,0 +1,139 @@
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff: a random delay in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RetryStats:
+    """Thread-safe counters for retries and time spent backing off."""
+
+    def __init__(self):
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.gave_up = 0
+        self._lock = threading.Lock()
+
+    def record_retry(self, delay):
+        with self._lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+
+    def record_give_up(self):
+        with self._lock:
+            self.gave_up += 1
+
+
+def call_with_backoff(fn, is_retryable, max_retries=5, base=1.0, cap=60.0, stats=None, on_retry=None):
+    """
+    Call fn(), retrying with jittered exponential backoff while is_retryable(error)
+    is true. on_retry(error) is invoked before each sleep. The last error is
+    re-raised once max_retries retries have been used.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                if stats is not None and attempt:
+                    stats.record_give_up()
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            delay = backoff_delay(attempt, base, cap)
+            if stats is not None:
+                stats.record_retry(delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit. Every `window` completions the throughput of the
+    window is compared with the previous one and the limit grows by one while
+    throughput keeps improving. throttled() halves the limit immediately.
+    """
+
+    def __init__(self, initial=3, minimum=1, maximum=8, window=5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.peak = self.limit
+        self.window = window
+        self.active = 0
+        self._cond = threading.Condition()
+        self._window_start = time.monotonic()
+        self._window_units = 0
+        self._window_count = 0
+        self._last_rate = 0.0
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+    def completed(self, units=1):
+        """Report a finished unit of work (e.g. bytes transferred)."""
+        with self._cond:
+            self._window_units += units
+            self._window_count += 1
+            if self._window_count < self.window:
+                return
+            elapsed = max(time.monotonic() - self._window_start, 1e-6)
+            rate = self._window_units / elapsed
+            if rate > self._last_rate and self.limit < self.maximum:
+                self.limit += 1
+                self.peak = max(self.peak, self.limit)
+                self._cond.notify_all()
+            self._last_rate = rate
+            self._window_start = time.monotonic()
+            self._window_units = 0
+            self._window_count = 0
+
+    def throttled(self):
+        """Back off after a rate-limit or server error."""
+        with self._cond:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._last_rate = 0.0
+
+
+class TokenBucket:
+    """
+    Blocking token bucket: acquire() waits until a token is available. Tokens
+    refill at `rate` per second up to `capacity` (default: one, i.e. requests
+    are spaced evenly instead of bursting).
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(max(1, capacity))
+        self.tokens = self.capacity
+        self.waited_seconds = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+                self.waited_seconds += wait
+            time.sleep(wait)
@@ -0,0 +1,189 @@
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from common.paths import cache_path
+
+DEFAULT_MIRROR_SETTINGS = {
+    'enabled': False,
+    'full_resync_hours': 24,
+}
+# Re-fetch records modified slightly before the last sync to absorb clock skew
+SYNC_OVERLAP_SECONDS = 300
+SQLITE_MAX_VARIABLES = 900
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}')
+# Bumped when stored columns change meaning, forcing a full resync of existing mirrors
+MIRROR_SCHEMA_VERSION = '2'
+
+
+def load_mirror_settings(settings=None):
+    """config.json "airtable_mirror" merged over DEFAULT_MIRROR_SETTINGS."""
+    return {**DEFAULT_MIRROR_SETTINGS, **(settings or {})}
+
+
+def format_timestamp(moment):
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def parse_timestamp(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.000Z').replace(tzinfo=timezone.utc)
+
+
+def parse_schedule_date(value):
+    """
+    'YYYY-MM-DD' for a Schedule Date given as an ISO date(time) or as the
+    '%d/%m/%Y' text the scheduler reads, or None if it is neither.
+    """
+    value = str(value or '').strip()
+    if DATE_PATTERN.match(value):
+        return value[:10]
+    try:
+        return datetime.strptime(value.split(' ')[0], '%d/%m/%Y').date().isoformat()
+    except ValueError:
+        return None
+
+
+class AirtableMirror:
+    """
+    Local SQLite copy of one Airtable table, kept in the plugin cache.
+
+    sync() fetches only records whose LAST_MODIFIED_TIME() is after the previous
+    sync and upserts them; every full_resync_hours it re-reads the whole table
+    instead, which is also how deleted records disappear from the mirror.
+    Usernames and schedule dates are indexed so per-account queries never go
+    back to Airtable. schedule_table marks a content schedule table, whose
+    records are expected to have a Schedule Date (undated ones are reported).
+    """
+
+    def __init__(self, base_id, table_id, db_path=None, schedule_table=False):
+        self.base_id = base_id
+        self.table_id = table_id
+        self.schedule_table = schedule_table
+        self.db_path = db_path or cache_path('airtable_mirror', f"{base_id}_{table_id}.db")
+        self.fetched = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS records (
+                    id TEXT PRIMARY KEY,
+                    username TEXT,
+                    schedule_date TEXT,
+                    created_time TEXT,
+                    fields TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS records_username ON records (username, schedule_date)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _row(record):
+        fields = record.get('fields', {})
+        return (
+            record['id'],
+            str(fields.get('Username', '')).strip().lower() or None,
+            parse_schedule_date(fields.get('Schedule Date')),
+            record.get('createdTime'),
+            json.dumps(fields),
+        )
+
+    def _upsert_pages(self, pages):
+        for page in pages:
+            rows = [self._row(record) for record in page]
+            self._conn.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)", rows)
+            self.fetched += len(rows)
+
+    def sync(self, api_key, full_resync_hours=DEFAULT_MIRROR_SETTINGS['full_resync_hours']):
+        """Bring the mirror up to date. Errors from Airtable propagate; the mirror is left as it was."""
+        from pyairtable import Api
+
+        table = Api(api_key).base(self.base_id).table(self.table_id)
+        started = datetime.now(timezone.utc)
+        self.fetched = 0
+        with self._lock, self._conn:
+            last_sync = self._meta('last_sync')
+            last_full_sync = self._meta('last_full_sync')
+            full = (
+                last_sync is None or last_full_sync is None
+                or self._meta('schema') != MIRROR_SCHEMA_VERSION
+                or started - parse_timestamp(last_full_sync) >= timedelta(hours=full_resync_hours)
+            )
+            if full:
+                print(f"🔄 Full sync of Airtable table {self.table_id}...")
+                self._conn.execute("DELETE FROM records")
+                self._upsert_pages(table.iterate())
+                self._set_meta('last_full_sync', format_timestamp(started))
+                self._set_meta('schema', MIRROR_SCHEMA_VERSION)
+            else:
+                since = parse_timestamp(last_sync) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+                formula = f"IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('{format_timestamp(since)}'))"
+                self._upsert_pages(table.iterate(formula=formula))
+            self._set_meta('last_sync', format_timestamp(started))
+            total, undated = self._conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(schedule_date) FROM records"
+            ).fetchone()
+        print(f"📦 Airtable mirror {self.table_id}: {'full' if full else 'incremental'} sync, "
+              f"{self.fetched} record(s) fetched, {total} stored")
+        if undated and self.schedule_table:
+            print(f"⚠️ {undated} mirrored record(s) have no readable Schedule Date and are left out of view queries")
+        return full
+
+    def usernames(self):
+        """Lowercased usernames of every mirrored record."""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT username FROM records WHERE username IS NOT NULL").fetchall()
+        return {row[0] for row in rows}
+
+    def iter_records_by_username(self, usernames=None, view_id=None):
+        """
+        Local equivalent of download_content.iter_records_by_username: yields
+        (username, [records]) in username order, limited to `usernames` when
+        given. With view_id only records whose Schedule Date (ISO or dd/mm/yyyy)
+        is no earlier than yesterday are returned, as build_schedule_formula does.
+        """
+        conditions, params = ["username IS NOT NULL"], []
+        if view_id:
+            yesterday = (datetime.now(timezone.utc).date() - timedelta(days=1)).isoformat()
+            conditions.append("schedule_date >= ?")
+            params.append(yesterday)
+        wanted = sorted({username.strip().lower() for username in usernames}) if usernames is not None else [None]
+
+        for i in range(0, len(wanted), SQLITE_MAX_VARIABLES):
+            chunk = wanted[i:i + SQLITE_MAX_VARIABLES]
+            query_conditions, query_params = list(conditions), list(params)
+            if usernames is not None:
+                query_conditions.append(f"username IN ({','.join('?' * len(chunk))})")
+                query_params.extend(chunk)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, username, created_time, fields FROM records "
+                    f"WHERE {' AND '.join(query_conditions)} ORDER BY username, created_time, id",
+                    query_params
+                ).fetchall()
+            current, group = None, []
+            for record_id, username, created_time, fields in rows:
+                if username != current:
+                    if group:
+                        yield current, group
+                    current, group = username, []
+                group.append({'id': record_id, 'createdTime': created_time, 'fields': json.loads(fields)})
+            if group:
+                yield current, group
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
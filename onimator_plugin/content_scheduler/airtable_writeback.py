@@ -0,0 +1,301 @@
+import os
+import json
+import fcntl
+import queue
+import threading
+from contextlib import contextmanager
+from common.atomic import atomic_write_lines
+from common.paths import cache_path
+from common.throttle import RetryStats, TokenBucket, call_with_backoff
+
+# Airtable accepts at most 10 records per update request and 5 requests per second per base
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_REQUESTS_PER_SECOND = 5
+WRITEBACK_WORKERS = 2
+WRITEBACK_MAX_RETRIES = 6
+# Validation errors: Airtable refused the records themselves, so resending them cannot help
+REJECTED_STATUSES = {422}
+
+
+def writeback_journal_dir():
+    journal_dir = cache_path('airtable_writeback')
+    os.makedirs(journal_dir, exist_ok=True)
+    return journal_dir
+
+
+@contextmanager
+def journal_dir_lock(journal_dir):
+    """Exclusive lock serialising replay and compaction of the journals in journal_dir."""
+    with open(os.path.join(journal_dir, '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def airtable_status(error):
+    """HTTP status of a failed Airtable request, or None if no response was received."""
+    return getattr(getattr(error, 'response', None), 'status_code', None)
+
+
+def is_retryable_airtable_error(error):
+    """True for 429s, 5xx responses and dropped connections."""
+    status = airtable_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    import requests
+
+    return isinstance(error, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout))
+
+
+def read_journal(journal_path):
+    """
+    Replay a write-back journal and return the records that were submitted but
+    never confirmed, as {(base_id, table_id): {record_id: record}}.
+    A torn last line (crash mid-write) is ignored.
+    """
+    pending = {}
+    if not os.path.exists(journal_path):
+        return pending
+    with open(journal_path, 'r') as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            records = pending.setdefault((entry['base_id'], entry['table_id']), {})
+            if entry['op'] == 'submit':
+                for record in entry['records']:
+                    records[record['id']] = record
+            else:
+                for record_id in entry['ids']:
+                    records.pop(record_id, None)
+    return {table: records for table, records in pending.items() if records}
+
+
+def journal_lines(pending):
+    return [
+        json.dumps({'op': 'submit', 'base_id': base_id, 'table_id': table_id, 'records': list(records.values())})
+        for (base_id, table_id), records in pending.items()
+    ]
+
+
+def claim_orphaned_journals(journal_dir, own_path):
+    """
+    Journals in journal_dir whose writer has exited (nobody holds their flock),
+    as [(path, open_file)]. The files stay locked until the caller closes them.
+    Call with journal_dir_lock held.
+    """
+    claimed = []
+    for name in sorted(os.listdir(journal_dir)):
+        path = os.path.join(journal_dir, name)
+        if not name.endswith('.jsonl') or path == own_path:
+            continue
+        try:
+            file = open(path, 'r')
+        except FileNotFoundError:
+            continue
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another run is still writing this journal
+            file.close()
+            continue
+        claimed.append((path, file))
+    return claimed
+
+
+class AirtableWriteback:
+    """
+    Background queue for Airtable record updates shared by every account in a
+    run. Records are packed into full batches of 10 across accounts, sent by a
+    few worker threads under a per-base token bucket (5 requests/sec) and
+    retried with backoff on 429s and server errors.
+
+    Every submission and every confirmed batch is appended to a JSONL journal
+    in the plugin cache, so updates that were never sent (crash, network loss,
+    retries exhausted, auth errors) are replayed by start() on the next run.
+    Each writer has its own journal file, flock'ed for as long as it is open;
+    start() only takes over journals whose writer has exited, so runs started
+    at the same time (e.g. from cron) never replay or rewrite each other's.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        journal_dir=None,
+        requests_per_second=AIRTABLE_REQUESTS_PER_SECOND,
+        workers=WRITEBACK_WORKERS,
+        max_retries=WRITEBACK_MAX_RETRIES
+    ):
+        self.api_key = api_key
+        self.journal_dir = journal_dir or writeback_journal_dir()
+        self.journal_path = os.path.join(self.journal_dir, f"{os.getpid()}-{id(self):x}.jsonl")
+        self.requests_per_second = requests_per_second
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.stats = RetryStats()
+        self.sent = 0
+        self.requests = 0
+        self.failed = 0
+        self.replayed = 0
+        self._api = None
+        self._tables = {}
+        self._buckets = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._journal = None
+        self._queue = queue.Queue()
+        self._threads = []
+
+    def start(self):
+        """Open the journal, queue anything left over from earlier runs and start the senders."""
+        with journal_dir_lock(self.journal_dir):
+            orphans = claim_orphaned_journals(self.journal_dir, self.journal_path)
+            leftover = {}
+            try:
+                for path, _ in orphans:
+                    for table, records in read_journal(path).items():
+                        leftover.setdefault(table, {}).update(records)
+                # The leftovers are in our (locked) journal before the old files go away
+                atomic_write_lines(self.journal_path, journal_lines(leftover))
+                self._journal = open(self.journal_path, 'a')
+                fcntl.flock(self._journal, fcntl.LOCK_EX)
+                for path, _ in orphans:
+                    os.remove(path)
+            finally:
+                for _, file in orphans:
+                    file.close()
+        for (base_id, table_id), records in leftover.items():
+            self.replayed += len(records)
+            self._enqueue(base_id, table_id, list(records.values()))
+        if self.replayed:
+            print(f"♻️ Replaying {self.replayed} unsent Airtable update(s) from a previous run")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'airtable-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, base_id, table_id, records):
+        """Journal the records and queue them; full batches go out as soon as they fill up."""
+        if not records:
+            return
+        with self._lock:
+            self._write_journal({'op': 'submit', 'base_id': base_id, 'table_id': table_id, 'records': records})
+        self._enqueue(base_id, table_id, records)
+
+    def close(self):
+        """Send the remaining partial batches, wait for the senders and compact the journal."""
+        with self._lock:
+            for (base_id, table_id), records in self._pending.items():
+                if records:
+                    self._queue.put((base_id, table_id, records))
+            self._pending = {}
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        if self._journal is None:
+            return 0
+        # Compact while still holding our journal's flock so no other run claims it half-written
+        with journal_dir_lock(self.journal_dir):
+            unsent = read_journal(self.journal_path)
+            if unsent:
+                atomic_write_lines(self.journal_path, journal_lines(unsent))
+            else:
+                os.remove(self.journal_path)
+            self._journal.close()
+            self._journal = None
+        return sum(len(records) for records in unsent.values())
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _write_journal(self, entry):
+        self._journal.write(json.dumps(entry) + '\n')
+        self._journal.flush()
+
+    def _enqueue(self, base_id, table_id, records):
+        with self._lock:
+            pending = self._pending.setdefault((base_id, table_id), [])
+            pending.extend(records)
+            while len(pending) >= AIRTABLE_BATCH_SIZE:
+                self._queue.put((base_id, table_id, pending[:AIRTABLE_BATCH_SIZE]))
+                del pending[:AIRTABLE_BATCH_SIZE]
+
+    def _table(self, base_id, table_id):
+        from pyairtable import Api
+
+        with self._lock:
+            if self._api is None:
+                self._api = Api(self.api_key)
+            key = (base_id, table_id)
+            if key not in self._tables:
+                self._tables[key] = self._api.table(base_id, table_id)
+                self._buckets.setdefault(base_id, TokenBucket(self.requests_per_second))
+            return self._tables[key], self._buckets[base_id]
+
+    def _send(self, base_id, table_id, records):
+        table, bucket = self._table(base_id, table_id)
+
+        def update():
+            bucket.acquire()
+            with self._lock:
+                self.requests += 1
+            return table.batch_update(records)
+
+        call_with_backoff(update, is_retryable_airtable_error, max_retries=self.max_retries, stats=self.stats)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._deliver(*item)
+
+    def _deliver(self, base_id, table_id, records):
+        try:
+            self._send(base_id, table_id, records)
+        except Exception as e:
+            if airtable_status(e) not in REJECTED_STATUSES:
+                # Network, rate-limit, auth (401/403) or not-found errors: keep the records journaled
+                print(f"⚠️ Airtable update of {len(records)} record(s) postponed to the next run: {e}")
+            elif len(records) == 1:
+                self._reject(base_id, table_id, records[0], e)
+            else:
+                # One bad record fails the whole request: send the others on their own
+                for record in records:
+                    self._deliver(base_id, table_id, [record])
+            return
+        self._confirm(base_id, table_id, records)
+
+    def _confirm(self, base_id, table_id, records):
+        with self._lock:
+            self.sent += len(records)
+            self._write_journal({'op': 'done', 'base_id': base_id, 'table_id': table_id,
+                                 'ids': [record['id'] for record in records]})
+
+    def _reject(self, base_id, table_id, record, error):
+        print(f"❌ Airtable rejected the update of record {record['id']}: {error}")
+        with self._lock:
+            self.failed += 1
+            self._write_journal({'op': 'failed', 'base_id': base_id, 'table_id': table_id,
+                                 'ids': [record['id']], 'error': str(error)})
+
+    def print_summary(self, unsent=0):
+        print("\n📤 Airtable Write-back Summary:")
+        print(f"→ Records: {self.sent} updated in {self.requests} request(s), {self.failed} rejected")
+        if self.replayed:
+            print(f"→ Replayed from the previous run: {self.replayed}")
+        print(f"→ Retries: {self.stats.retries} ({self.stats.gave_up} gave up), "
+              f"backoff {self.stats.backoff_seconds:.1f}s")
+        if unsent:
+            print(f"⚠️ {unsent} update(s) could not be sent and will be retried on the next run")
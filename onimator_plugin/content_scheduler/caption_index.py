@@ -0,0 +1,162 @@
+import os
+import hashlib
+import sqlite3
+
+from common.paths import cache_path
+
+
+def normalize_caption(caption):
+    """Collapse whitespace and case so trivially different captions share one key."""
+    return ' '.join(str(caption or '').split()).casefold()
+
+def caption_hash(caption):
+    return hashlib.sha1(normalize_caption(caption).encode('utf-8')).hexdigest()
+
+
+class CaptionIndex:
+    """
+    Duplicate-caption index for one account's scheduled_post.db.
+
+    The index lives in a plugin-owned sidecar database under the plugin cache
+    directory, so Onimator's schema is never altered. It is keyed on a hash of
+    the normalized caption and is brought up to date by refresh(), which
+    compares the row count and max rowid with the last refresh: new rows are
+    indexed incrementally by rowid, and anything else (deletes, or the DB or
+    its -wal file changing with the same rows, i.e. captions edited in place)
+    triggers a full rebuild.
+    With a SQLitePool the sidecar connection is taken from (and left open in)
+    the pool instead of being opened for each account batch.
+    """
+
+    def __init__(self, db_path, index_path=None, pool=None):
+        self.db_path = os.path.abspath(db_path)
+        if index_path is None:
+            key = hashlib.sha1(self.db_path.encode('utf-8')).hexdigest()[:16]
+            index_path = cache_path('caption_index', f"{key}.db")
+        self.index_path = index_path
+        self.pool = pool
+        self.conn = pool.get(index_path) if pool is not None else sqlite3.connect(index_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS captions (
+                caption_hash TEXT NOT NULL,
+                post_id TEXT,
+                scheduled_date TEXT,
+                file_location TEXT,
+                src_rowid INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_captions_hash ON captions (caption_hash);
+            CREATE INDEX IF NOT EXISTS idx_captions_post_id ON captions (post_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is None:
+            self.conn.close()
+
+    def _file_signature(self):
+        """mtime and size of the DB and its -wal file: in WAL mode new rows only touch the -wal file."""
+        signature = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                stat = os.stat(path)
+                signature.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+            except FileNotFoundError:
+                signature.append('-')
+        return ','.join(signature)
+
+    def _get_meta(self):
+        meta = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        return {
+            'db_path': meta.get('db_path'),
+            'signature': meta.get('signature'),
+            'row_count': int(meta.get('row_count', -1)),
+            'max_rowid': int(meta.get('max_rowid', -1)),
+        }
+
+    def _set_meta(self, **values):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()]
+        )
+
+    def _index_rows(self, db_cursor, min_rowid):
+        db_cursor.execute(
+            "SELECT rowid, post_id, caption, scheduled_date, file_location "
+            "FROM scheduled_post WHERE rowid > ?",
+            (min_rowid,)
+        )
+        rows = [
+            (caption_hash(caption), post_id, scheduled_date, file_location, rowid)
+            for rowid, post_id, caption, scheduled_date, file_location in db_cursor.fetchall()
+        ]
+        self.conn.executemany(
+            "INSERT INTO captions (caption_hash, post_id, scheduled_date, file_location, src_rowid) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        return len(rows)
+
+    def refresh(self, db_conn):
+        """Bring the index in line with the scheduled_post table behind db_conn."""
+        signature = self._file_signature()
+        meta = self._get_meta()
+
+        db_cursor = db_conn.cursor()
+        db_cursor.execute("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM scheduled_post")
+        row_count, max_rowid = db_cursor.fetchone()
+
+        with self.conn:
+            if meta['db_path'] == self.db_path and meta['row_count'] >= 0:
+                if row_count == meta['row_count'] and max_rowid == meta['max_rowid']:
+                    if meta['signature'] == signature:
+                        return
+                elif max_rowid > meta['max_rowid']:
+                    added = self._index_rows(db_cursor, meta['max_rowid'])
+                    if meta['row_count'] + added == row_count:
+                        self._set_meta(signature=signature, row_count=row_count, max_rowid=max_rowid)
+                        return
+
+            # Rows were deleted or edited since the last refresh: rebuild from scratch.
+            self.conn.execute("DELETE FROM captions")
+            self._index_rows(db_cursor, -1)
+            self._set_meta(
+                db_path=self.db_path, signature=signature, row_count=row_count, max_rowid=max_rowid
+            )
+
+    def lookup(self, captions):
+        """
+        Return {caption: (post_id, scheduled_date, file_location)} for every caption
+        that already has a scheduled post.
+        """
+        found = {}
+        cursor = self.conn.cursor()
+        for caption in captions:
+            if caption in found:
+                continue
+            cursor.execute(
+                "SELECT post_id, scheduled_date, file_location FROM captions "
+                "WHERE caption_hash = ? ORDER BY src_rowid LIMIT 1",
+                (caption_hash(caption),)
+            )
+            row = cursor.fetchone()
+            if row:
+                found[caption] = row
+        return found
+
+    def remove(self, post_ids):
+        """Drop posts we deleted from the DB so the next refresh stays incremental."""
+        if not post_ids:
+            return
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.executemany("DELETE FROM captions WHERE post_id = ?", [(post_id,) for post_id in post_ids])
+            removed = cursor.rowcount if cursor.rowcount >= 0 else 0
+            meta = self._get_meta()
+            if meta['row_count'] >= 0:
+                self._set_meta(row_count=meta['row_count'] - removed)
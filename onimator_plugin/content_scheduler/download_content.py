@@ -1,31 +1,165 @@
 import os
-import csv
-import json
-import pandas as pd
-import requests
-import argparse
 import datetime
-import sys
 import re
 import io
-import platform
+import threading
+import hashlib
 from pathlib import Path
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from pyairtable import Api
-from pyairtable.formulas import match
-from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from common.atomic import fsync_directory
+from common.throttle import AdaptiveConcurrency, RetryStats, call_with_backoff
+from .records import ContentRecord
+
+# Google, Airtable and tqdm imports are deferred to the functions that use them,
+# so importing this module (e.g. to show the CLI menus) stays fast.
 
 
 # Define the scopes required for Google Drive API
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 
+# Defaults for the "download" section of config.json
+DEFAULT_DOWNLOAD_SETTINGS = {
+    'initial_workers': 3,
+    'min_workers': 1,
+    'max_workers': 8,
+    'max_retries': 6,
+    'backoff_base_seconds': 1,
+    'backoff_max_seconds': 64,
+    'chunk_size_mb': 16,
+}
+DRIVE_RATE_LIMIT_REASONS = ('userRateLimitExceeded', 'rateLimitExceeded')
+DRIVE_HTTP_TIMEOUT = 120
+
+# Each worker thread keeps its own Drive client (httplib2 is not thread-safe)
+_drive_local = threading.local()
+
+def get_drive_service(creds):
+    """
+    Return the calling thread's Drive client, building it on first use.
+    The client wraps a persistent httplib2 connection, so repeated requests from
+    the same worker reuse one keep-alive connection across rows and accounts.
+    """
+    service = getattr(_drive_local, 'service', None)
+    if service is None or getattr(_drive_local, 'creds', None) is not creds:
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build
+
+        http = AuthorizedHttp(creds, http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT))
+        service = build('drive', 'v3', http=http, cache_discovery=False)
+        _drive_local.service = service
+        _drive_local.creds = creds
+    return service
+
+# Metadata needed to name, cache-key and verify a download
+DRIVE_METADATA_FIELDS = "id,name,mimeType,md5Checksum,modifiedTime,size"
+# Google's limit on calls per batch request
+DRIVE_BATCH_SIZE = 100
+
+def prefetch_drive_metadata(drive_service, file_ids, fields=DRIVE_METADATA_FIELDS):
+    """
+    Resolve metadata for many Drive files using batch requests of up to
+    DRIVE_BATCH_SIZE calls each. Returns {file_id: metadata}; files whose lookup
+    failed are left out so callers can fall back to a single files().get().
+    """
+    metadata = {}
+    file_ids = list(dict.fromkeys(file_id for file_id in file_ids if file_id))
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            print(f"⚠️ Metadata lookup failed for {request_id}: {exception}")
+        else:
+            metadata[request_id] = response
+
+    for i in range(0, len(file_ids), DRIVE_BATCH_SIZE):
+        chunk = file_ids[i:i + DRIVE_BATCH_SIZE]
+        batch = drive_service.new_batch_http_request(callback=callback)
+        for file_id in chunk:
+            batch.add(drive_service.files().get(fileId=file_id, fields=fields), request_id=file_id)
+        try:
+            batch.execute()
+        except Exception as e:
+            print(f"⚠️ Batch metadata request failed for {len(chunk)} file(s): {e}")
+    return metadata
+
+def is_retryable_drive_error(error):
+    """True for Drive rate limits (403/429), 5xx responses and dropped connections."""
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError):
+        status = getattr(error.resp, 'status', None)
+        if status == 429 or (status is not None and int(status) >= 500):
+            return True
+        if status == 403:
+            return any(reason in str(error) for reason in DRIVE_RATE_LIMIT_REASONS)
+        return False
+    return isinstance(error, (ConnectionError, TimeoutError, httplib2.HttpLib2Error))
+
+
+class DownloadThrottle:
+    """
+    Run-wide download controller: an adaptive concurrency limit shared by all
+    download workers, plus jittered exponential retries for Drive calls that
+    hit rate limits or server errors. Settings come from config.json "download".
+    """
+
+    def __init__(self, settings=None):
+        self.settings = dict(DEFAULT_DOWNLOAD_SETTINGS, **(settings or {}))
+        self.concurrency = AdaptiveConcurrency(
+            initial=self.settings['initial_workers'],
+            minimum=self.settings['min_workers'],
+            maximum=self.settings['max_workers'],
+        )
+        self.stats = RetryStats()
+        self.downloaded = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self):
+        return self.concurrency.maximum
+
+    def call(self, fn):
+        """Call a Drive request function, retrying rate-limit and 5xx failures."""
+        from googleapiclient.errors import HttpError
+
+        def on_retry(error):
+            if isinstance(error, HttpError):
+                self.concurrency.throttled()
+
+        return call_with_backoff(
+            fn,
+            is_retryable_drive_error,
+            max_retries=self.settings['max_retries'],
+            base=self.settings['backoff_base_seconds'],
+            cap=self.settings['backoff_max_seconds'],
+            stats=self.stats,
+            on_retry=on_retry,
+        )
+
+    def record(self, ok, nbytes=0):
+        with self._lock:
+            if ok:
+                self.downloaded += 1
+            else:
+                self.failed += 1
+        if ok:
+            self.concurrency.completed(max(nbytes, 1))
+
+    def print_summary(self):
+        print("\n📶 Download Summary:")
+        print(f"→ Files: {self.downloaded} ok, {self.failed} failed")
+        print(f"→ Workers: limit {self.concurrency.limit}, peak {self.concurrency.peak}, max {self.max_workers}")
+        print(f"→ Retries: {self.stats.retries} ({self.stats.gave_up} gave up), "
+              f"backoff {self.stats.backoff_seconds:.1f}s")
+
+
+def create_download_executor(max_workers=DEFAULT_DOWNLOAD_SETTINGS['max_workers']):
+    """Create a download pool that can be shared by several process_content_schedule calls."""
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='drive')
+
 def extract_file_id(drive_url):
     """Extract the file ID from a Google Drive URL."""
     patterns = [
@@ -43,6 +177,10 @@ def extract_file_id(drive_url):
 
 def authenticate_google_drive():
     """Authenticate with Google Drive API."""
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
     print("Authenticating with Google Drive...")
     
     # Get the directory where this script is located
@@ -90,14 +228,16 @@ def authenticate_google_drive():
     
     return creds
 
-def detect_file_extension(drive_service, file_id, url):
+def detect_file_extension(drive_service, file_id, url, file_metadata=None):
     """
     Detect file extension from Google Drive metadata.
     Falls back to URL parsing if metadata doesn't have the extension.
+    Pass prefetched `file_metadata` to skip the metadata request.
     """
     try:
         # First try to get the extension from Google Drive metadata
-        file_metadata = drive_service.files().get(fileId=file_id, fields="name,mimeType").execute()
+        if file_metadata is None:
+            file_metadata = drive_service.files().get(fileId=file_id, fields="name,mimeType").execute()
         
         # Extract extension from original filename
         original_name = file_metadata.get('name', '')
@@ -139,11 +279,14 @@ def detect_file_extension(drive_service, file_id, url):
         print(f"Error detecting file extension: {e}")
         return '.mp4'
 
-def download_file(drive_service, file_id, output_folder, filename=None):
+def download_file(drive_service, file_id, output_folder, filename=None, file_metadata=None):
     """Download a file from Google Drive."""
+    from googleapiclient.http import MediaIoBaseDownload
+
     try:
         # Get file metadata to determine the name and MIME type
-        file_metadata = drive_service.files().get(fileId=file_id).execute()
+        if file_metadata is None:
+            file_metadata = drive_service.files().get(fileId=file_id).execute()
         
         # Use the original filename from Drive if no custom name provided
         if not filename:
@@ -170,6 +313,86 @@ def download_file(drive_service, file_id, output_folder, filename=None):
         print(f"Error downloading file {file_id}: {e}")
         return None
 
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def download_media(drive_service, file_id, output_path, throttle=None, file_metadata=None, chunk_size=None):
+    """
+    Download a Drive file's content to output_path.
+
+    Bytes go to `<output_path>.part` in Range requests of chunk_size bytes. If a
+    previous run was interrupted, the transfer resumes from the size of the
+    existing .part file. Once complete, the file is checked against the Drive
+    size/md5Checksum in file_metadata, fsync'd and atomically renamed, so
+    output_path only ever holds complete media. With a DownloadThrottle, a
+    chunk that fails on a rate limit or server error is retried in place.
+    """
+    from googleapiclient.errors import HttpError
+
+    if chunk_size is None:
+        chunk_size = int((throttle.settings if throttle else DEFAULT_DOWNLOAD_SETTINGS)['chunk_size_mb'] * 1024 * 1024)
+    file_metadata = file_metadata or {}
+    expected_size = int(file_metadata['size']) if file_metadata.get('size') else None
+    expected_md5 = file_metadata.get('md5Checksum')
+
+    part_path = f"{output_path}.part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if expected_size is not None and offset > expected_size:
+        offset = 0
+    if offset:
+        print(f"↪️ Resuming {os.path.basename(output_path)} from {offset} bytes")
+
+    request = drive_service.files().get_media(fileId=file_id)
+    http, uri = request.http, request.uri
+
+    def fetch_range(start):
+        headers = {'range': f"bytes={start}-{start + chunk_size - 1}"}
+        resp, content = http.request(uri, method='GET', headers=headers)
+        if resp.status >= 400 and resp.status != 416:
+            raise HttpError(resp, content, uri=uri)
+        return resp, content
+
+    with open(part_path, 'r+b' if offset else 'wb') as fh:
+        fh.seek(offset)
+        fh.truncate()
+        while expected_size is None or offset < expected_size:
+            if throttle is not None:
+                resp, content = throttle.call(lambda: fetch_range(offset))
+            else:
+                resp, content = fetch_range(offset)
+            if resp.status == 416:
+                break
+            if resp.status == 200 and offset:
+                # Server ignored the Range header and sent the whole file
+                fh.seek(0)
+                fh.truncate()
+                offset = 0
+            fh.write(content)
+            offset += len(content)
+
+            content_range = resp.get('content-range', '')
+            if expected_size is None and '/' in content_range and not content_range.endswith('/*'):
+                expected_size = int(content_range.rsplit('/', 1)[1])
+            if resp.status == 200 or not content or expected_size is None:
+                break
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    actual_size = os.path.getsize(part_path)
+    if expected_size is not None and actual_size != expected_size:
+        raise IOError(f"Incomplete download for {file_id}: {actual_size} of {expected_size} bytes")
+    if expected_md5 and file_md5(part_path) != expected_md5:
+        os.remove(part_path)
+        raise IOError(f"Checksum mismatch for {file_id}, discarded partial download")
+
+    os.replace(part_path, output_path)
+    fsync_directory(os.path.dirname(os.path.abspath(output_path)))
+    return output_path
+
 def ensure_dir_exists(directory):
     """Ensure a directory exists, creating it if necessary."""
     Path(directory).mkdir(parents=True, exist_ok=True)
@@ -204,72 +427,153 @@ def get_record_count():
         except ValueError:
             print("Invalid input. Please enter a number.")
 
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-from tqdm import tqdm
-
-def process_content_schedule(
-    airtable_pat, base_id, table_id, view_id, output_folder, _, profile, device, record_limit=None, update_all=False
-):
-    print("Authenticating with Airtable...")
-    api = Api(airtable_pat)
-    base = api.base(base_id)
-    table = base.table(table_id)
-
-    # Build Airtable formula
+def build_schedule_formula(profile, view_id, update_all=False):
+    """Build the Airtable filter formula used to select scheduled content."""
     formula_parts = []
     if not update_all and profile:
         formula_parts.append(f"LOWER({{Username}}) = LOWER('{profile}')")
     if view_id:
         formula_parts.append("NOT(IS_AFTER(TODAY(), DATEADD({Schedule Date}, 1, 'days')))")
-    formula = "AND(" + ",".join(formula_parts) + ")" if formula_parts else None
-    fetch_limit = record_limit * 2 if record_limit else None
+    return "AND(" + ",".join(formula_parts) + ")" if formula_parts else None
+
+def record_username(record):
+    return str(record.get("fields", {}).get("Username", "")).strip().lower()
+
+def iter_records_by_username(airtable_pat, base_id, table_id, view_id):
+    """
+    Stream every scheduled record for a model from one paginated query sorted by
+    Username, yielding (username, [records]) as soon as each username's records
+    are complete, so callers can start on the first accounts before the last
+    page has been fetched. Usernames are lowercased and stripped, which the
+    sort on the raw field doesn't follow exactly (case, stray spaces), so a
+    username is only yielded once a record for a later username arrives.
+    Records that still turn up after their username was yielded follow as a
+    second batch for that username once the query is done.
+    Errors from Airtable propagate to the caller.
+    """
+    from pyairtable import Api
+
+    print("Authenticating with Airtable...")
+    api = Api(airtable_pat)
+    table = api.base(base_id).table(table_id)
+    formula = build_schedule_formula(None, view_id, update_all=True)
 
-    print("\n🔍 Airtable Query Details:")
-    print(f"→ Profile: {profile}")
-    print(f"→ Update All: {update_all}")
+    print("\n🔍 Airtable Bulk Query Details:")
     print(f"→ Formula: {formula if formula else 'No filtering'}")
     print(f"→ View ID: {view_id if view_id else 'No view specified'}")
-    print(f"→ Record Limit: {fetch_limit if fetch_limit else 'No limit'}")
 
-    try:
-        records = table.all(formula=formula, max_records=fetch_limit)
-    except Exception as e:
-        print(f"❌ Error fetching records: {e}")
-        import traceback
-        print(traceback.format_exc())
-        return None
+    yielded = set()
+    pending = {}
+    late = {}
+    total = 0
+    for page in table.iterate(formula=formula, sort=["Username"]):
+        for record in page:
+            total += 1
+            username = record_username(record)
+            if not username:
+                continue
+            if username in yielded:
+                late.setdefault(username, []).append(record)
+                continue
+            if username not in pending:
+                # The query has moved past every pending username that sorts before this one
+                for done in sorted(name for name in pending if name < username):
+                    yielded.add(done)
+                    yield done, pending.pop(done)
+                pending[username] = []
+            pending[username].append(record)
+    for username in sorted(pending):
+        yielded.add(username)
+        yield username, pending[username]
+    for username, records in late.items():
+        print(f"⚠️ {len(records)} record(s) for {username} arrived after the account was started; "
+              f"processing them as a second batch")
+        yield username, records
+
+    print(f"📊 Fetched {total} records for {len(yielded)} usernames")
+
+def process_content_schedule(
+    airtable_pat, base_id, table_id, view_id, output_folder, _, profile, device, record_limit=None, update_all=False,
+    records=None, creds=None, executor=None, media_cache=None, drive_metadata=None, throttle=None
+):
+    """
+    Download the scheduled content for a profile and return it as a list of
+    ContentRecord objects whose media_file_path points at the local file.
+    When `records` is given (see iter_records_by_username) the Airtable query is
+    skipped, and when `creds` is given Google Drive is not re-authenticated.
+    Passing a shared `executor` (see create_download_executor) lets its worker
+    threads keep their Drive clients across calls, and a `media_cache`
+    (MediaCache) downloads each Drive file revision only once across accounts.
+    Drive metadata is prefetched in batches; `drive_metadata` may supply
+    entries that were already resolved. A shared `throttle` (DownloadThrottle)
+    carries the adaptive worker limit and retry totals across calls.
+    """
+    from tqdm import tqdm
+
+    if records is None:
+        from pyairtable import Api
+
+        print("Authenticating with Airtable...")
+        api = Api(airtable_pat)
+        base = api.base(base_id)
+        table = base.table(table_id)
+
+        # Build Airtable formula
+        formula = build_schedule_formula(profile, view_id, update_all)
+        fetch_limit = record_limit * 2 if record_limit else None
+
+        print("\n🔍 Airtable Query Details:")
+        print(f"→ Profile: {profile}")
+        print(f"→ Update All: {update_all}")
+        print(f"→ Formula: {formula if formula else 'No filtering'}")
+        print(f"→ View ID: {view_id if view_id else 'No view specified'}")
+        print(f"→ Record Limit: {fetch_limit if fetch_limit else 'No limit'}")
+
+        try:
+            records = table.all(formula=formula, max_records=fetch_limit)
+        except Exception as e:
+            print(f"❌ Error fetching records: {e}")
+            import traceback
+            print(traceback.format_exc())
+            return None
 
     print("\n🔍 Analyzing Records:")
     data = []
     for record in records:
         fields = record.get("fields", {})
-        fields['id'] = record['id']
         media_url = fields.get("media_file_path", "")
-        if media_url and "drive.google.com" in media_url:
-            data.append(fields)
+        if isinstance(media_url, str) and "drive.google.com" in media_url:
+            data.append(ContentRecord(record['id'], fields, device_id=device['id']))
 
     print(f"\n📊 Valid records with Drive URLs: {len(data)}")
     if not data:
         print("❌ No valid records found with Google Drive URLs")
         return None
 
-    df = pd.DataFrame(data)
-    if 'media_file_path' not in df.columns:
-        print("❌ Missing media_file_path column.")
-        return None
+    if creds is None:
+        print("\n🔐 Authenticating with Google Drive...")
+        creds = authenticate_google_drive()
 
-    print("\n🔐 Authenticating with Google Drive...")
-    creds = authenticate_google_drive()
-    drive_service = build('drive', 'v3', credentials=creds)
+    owns_throttle = throttle is None
+    if owns_throttle:
+        throttle = DownloadThrottle()
 
     print(f"\n📥 Downloading Content for {profile.capitalize()} (parallel)...")
 
-    def download_row(index, row, creds, output_folder, pbar):
+    print("\n🔎 Prefetching Drive metadata...")
+    file_ids = [extract_file_id(record.fields['media_file_path']) for record in data]
+    drive_metadata = dict(drive_metadata or {})
+    missing_ids = [file_id for file_id in file_ids if file_id and file_id not in drive_metadata]
+    if missing_ids:
+        drive_metadata.update(prefetch_drive_metadata(get_drive_service(creds), missing_ids))
+    print(f"→ Metadata resolved for {sum(1 for f in file_ids if f in drive_metadata)}/{len(file_ids)} file(s)")
+
+    def download_row(index, record, creds, output_folder, pbar):
         try:
-            # ✅ Build a drive_service inside each thread
-            drive_service = build('drive', 'v3', credentials=creds)
+            drive_service = get_drive_service(creds)
 
+            # File naming reads the raw Airtable fields, as it always has
+            row = record.fields
             drive_url = row['media_file_path']
             if not isinstance(drive_url, str) or 'drive.google.com' not in drive_url:
                 pbar.update(1)
@@ -280,7 +584,11 @@ def process_content_schedule(
                 pbar.update(1)
                 return None
 
-            file_metadata = drive_service.files().get(fileId=file_id, fields="name,mimeType").execute()
+            file_metadata = drive_metadata.get(file_id)
+            if file_metadata is None:
+                file_metadata = throttle.call(
+                    drive_service.files().get(fileId=file_id, fields=DRIVE_METADATA_FIELDS).execute
+                )
             original_name = file_metadata.get('name', '')
             extension = '.mp4'
 
@@ -311,50 +619,67 @@ def process_content_schedule(
             os.makedirs(output_dir, exist_ok=True)
             output_path = os.path.join(output_dir, filename)
 
-            if os.path.exists(output_path):
+            expected_size = file_metadata.get('size')
+            if os.path.exists(output_path) and (
+                not expected_size or os.path.getsize(output_path) == int(expected_size)
+            ):
                 print(f"⏭️ Skipping existing: {output_path}")
-                row['media_file_path'] = os.path.abspath(output_path)
+                record.media_file_path = os.path.abspath(output_path)
                 pbar.update(1)
-                return row
-
-            request = drive_service.files().get_media(fileId=file_id)
-            with io.FileIO(output_path, 'wb') as fh:
-                downloader = MediaIoBaseDownload(fh, request)
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
+                return record
+
+            if media_cache is not None:
+                hit = media_cache.fetch(
+                    file_id, file_metadata, output_path,
+                    lambda path: download_media(
+                        drive_service, file_id, path, throttle=throttle, file_metadata=file_metadata
+                    )
+                )
+                if hit:
+                    print(f"♻️ From cache: {output_path}")
+            else:
+                download_media(drive_service, file_id, output_path, throttle=throttle, file_metadata=file_metadata)
 
+            throttle.record(True, os.path.getsize(output_path))
             print(f"✓ Success: {output_path}")
-            row['media_file_path'] = os.path.abspath(output_path)
+            record.media_file_path = os.path.abspath(output_path)
             pbar.update(1)
-            return row
+            return record
 
         except Exception as e:
+            throttle.record(False)
             print(f"✗ Error processing record {index + 1}: {e}")
             pbar.update(1)
             return None
 
+    def throttled_download_row(index, record, **kwargs):
+        # The pool is sized for the maximum; the adaptive limit decides how many run
+        with throttle.concurrency.slot():
+            return download_row(index, record, **kwargs)
 
     successful_records = []
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        with tqdm(total=len(df), desc="📥 Downloading", unit="file") as pbar:
-            download_fn = partial(download_row, creds=creds, output_folder=output_folder, pbar=pbar)
-            futures = [executor.submit(download_fn, idx, row) for idx, row in df.iterrows()]
+    owns_executor = executor is None
+    if owns_executor:
+        executor = create_download_executor(throttle.max_workers)
+    try:
+        with tqdm(total=len(data), desc="📥 Downloading", unit="file") as pbar:
+            download_fn = partial(throttled_download_row, creds=creds, output_folder=output_folder, pbar=pbar)
+            futures = [executor.submit(download_fn, idx, record) for idx, record in enumerate(data)]
             for future in futures:
                 result = future.result()
                 if result is not None:
                     successful_records.append(result)
+    finally:
+        if owns_executor:
+            executor.shutdown(wait=True)
+
+    if owns_throttle:
+        throttle.print_summary()
 
     if not successful_records:
         print("❌ No successful downloads.")
         return None
 
-    output_df = pd.DataFrame(successful_records)
-    output_df.columns = [col.lower().replace(' (24h)', '').replace(' ', '_') for col in output_df.columns]
-    output_df.insert(0, 'device_id', device['id'])
-    if 'username' not in output_df.columns:
-        output_df['username'] = 'unknown'
-
     print(f"\n✅ {len(successful_records)} file(s) downloaded successfully.")
-    return output_df
+    return successful_records
 
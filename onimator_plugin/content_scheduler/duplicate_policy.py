@@ -0,0 +1,155 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+REPLACE = 'replace'
+SKIP = 'skip'
+KEEP_BOTH = 'keep-both'
+SKIP_ACCOUNT = 'skip-account'
+PROMPT = 'prompt'
+
+ACTIONS = [REPLACE, SKIP, KEEP_BOTH, SKIP_ACCOUNT]
+
+# Interactive answers accepted by the original insert_post prompt
+PROMPT_CHOICES = {'y': REPLACE, 's': SKIP, 'n': KEEP_BOTH, 'a': SKIP_ACCOUNT}
+
+
+def parse_db_date(value):
+    for fmt in ("%Y-%m-%d %H:%M", "%d/%m/%Y %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+class DuplicatePolicy:
+    """
+    Decides what to do when a post's caption is already scheduled.
+
+    action is one of 'replace', 'skip', 'keep-both', 'skip-account' or 'prompt'
+    (ask on the console, the original behaviour). The action only applies to
+    posts that count as duplicates; a post is kept alongside the existing one
+    instead when:
+      - within_days is set and the two scheduled dates are further apart, or
+      - match_file_hash is set and the two media files differ in content.
+    path_resolver maps a file_location stored in the DB to a local path for hashing.
+    Prompts are serialised, so devices scheduled in parallel ask one at a time.
+    Every decision is recorded and reported once at the end of the run.
+    """
+
+    def __init__(self, action=PROMPT, within_days=None, match_file_hash=False, path_resolver=None):
+        if action not in ACTIONS + [PROMPT]:
+            raise ValueError(f"Unknown duplicate action '{action}', expected one of {ACTIONS + [PROMPT]}")
+        self.action = action
+        self.within_days = within_days
+        self.match_file_hash = match_file_hash
+        self.path_resolver = path_resolver or (lambda path: path)
+        self.decisions = []
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self._prompt_lock = threading.Lock()
+
+    @property
+    def interactive(self):
+        return self.action == PROMPT
+
+    def _file_hash(self, file_location):
+        path = self.path_resolver(file_location)
+        if path not in self._hashes:
+            try:
+                digest = hashlib.sha1()
+                with open(path, 'rb') as fh:
+                    for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                        digest.update(chunk)
+                self._hashes[path] = digest.hexdigest()
+            except (OSError, TypeError):
+                self._hashes[path] = None
+        return self._hashes[path]
+
+    def _is_duplicate(self, existing, post):
+        _, existing_date, existing_path = existing
+        if self.within_days is not None:
+            old = parse_db_date(existing_date)
+            new = parse_db_date(post.get('scheduled_date'))
+            if old and new and abs((new - old).total_seconds()) > self.within_days * 86400:
+                return False, f"scheduled more than {self.within_days} day(s) apart"
+        if self.match_file_hash:
+            old_hash = self._file_hash(existing_path)
+            new_hash = self._file_hash(post.get('file_location'))
+            if old_hash and new_hash and old_hash != new_hash:
+                return False, "media files differ"
+        return True, "duplicate caption"
+
+    def _prompt(self, account, existing, caption):
+        existing_id, existing_date, existing_path = existing
+        with self._prompt_lock:
+            print(f"\n⚠️ Duplicate caption detected:")
+            if account:
+                print(f"→ Account: {account}")
+            print(f"→ Existing Post ID: {existing_id}")
+            print(f"→ Scheduled for: {existing_date}")
+            print(f"→ File: {existing_path}")
+            print(f"→ Caption: {caption}")
+            print("Options: [y] replace  [s] skip  [n] keep both  [a] skip all for this account")
+            choice = input("Your choice: ").strip().lower()
+        return PROMPT_CHOICES.get(choice, KEEP_BOTH)
+
+    def decide(self, account, existing, post):
+        """Return the action to take for post, given the existing (post_id, date, file) row."""
+        caption = post.get('caption', '')
+        is_duplicate, reason = self._is_duplicate(existing, post)
+        if not is_duplicate:
+            action = KEEP_BOTH
+        elif self.interactive:
+            action, reason = self._prompt(account, existing, caption), "user choice"
+        else:
+            action = self.action
+
+        with self._lock:
+            self.decisions.append({
+                'account': account,
+                'caption': caption,
+                'existing_post_id': existing[0],
+                'existing_date': existing[1],
+                'scheduled_date': post.get('scheduled_date'),
+                'action': action,
+                'reason': reason,
+            })
+        return action
+
+    def print_summary(self):
+        print("\n📋 Duplicate Summary:")
+        if not self.decisions:
+            print("→ No duplicate captions found")
+            return
+        counts = Counter(decision['action'] for decision in self.decisions)
+        for action in ACTIONS:
+            if counts[action]:
+                print(f"→ {action}: {counts[action]}")
+        per_account = Counter(decision['account'] for decision in self.decisions)
+        print("→ Accounts with duplicates: " + ", ".join(
+            f"{account} ({count})" for account, count in sorted(per_account.items(), key=lambda item: str(item[0]))
+        ))
+
+    def write_log(self, log_file):
+        """Append all decisions of this run to log_file in a single write."""
+        if not self.decisions:
+            return
+        try:
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            lines = [
+                f"{timestamp} - {d['account']} - {d['action']} ({d['reason']}) - "
+                f"existing {d['existing_post_id']} @ {d['existing_date']} - new @ {d['scheduled_date']} - "
+                f"{d['caption']!r}\n"
+                for d in self.decisions
+            ]
+            with open(log_file, 'a') as fh:
+                fh.writelines(lines)
+            logging.info(f"Logged {len(lines)} duplicate decisions to {log_file}")
+        except Exception as e:
+            print(f"⚠️ Failed to write duplicate log {log_file}: {e}")
@@ -0,0 +1,140 @@
+import os
+import shutil
+import hashlib
+import threading
+
+
+class MediaCache:
+    """
+    Content-addressed store for Drive media shared by every account and model.
+
+    Objects are keyed by Drive file ID plus md5Checksum/modifiedTime, so each
+    revision of a file is downloaded at most once. Per-account files are
+    hardlinks to the stored object (or plain copies where hardlinks are not
+    supported). Removing an object that is still linked from an account folder
+    frees no disk, so max_bytes only bounds the objects held by the cache
+    alone (st_nlink == 1): once those grow beyond it, the least recently used
+    of them are evicted. Linked objects are neither counted nor evicted.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    @staticmethod
+    def key(file_id, metadata):
+        version = metadata.get('md5Checksum') or metadata.get('modifiedTime') or ''
+        return hashlib.sha256(f"{file_id}:{version}".encode('utf-8')).hexdigest()
+
+    def object_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _iter_objects(self):
+        for shard in os.scandir(self.objects_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.endswith(('.download', '.part')):
+                    yield entry
+
+    def usage(self):
+        """(bytes held only by the cache, bytes of objects still linked from account folders)"""
+        own = linked = 0
+        for entry in self._iter_objects():
+            stat = entry.stat()
+            if stat.st_nlink > 1:
+                linked += stat.st_size
+            else:
+                own += stat.st_size
+        return own, linked
+
+    def size(self):
+        """Bytes held only by the cache, i.e. what evict() can free."""
+        return self.usage()[0]
+
+    def _link(self, source, output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        try:
+            os.link(source, output_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copyfile(source, output_path)
+
+    def fetch(self, file_id, metadata, output_path, download_fn):
+        """
+        Place the file at output_path, downloading it through download_fn(path)
+        only if this revision is not already in the store.
+        Returns True on a cache hit and False when it had to be downloaded.
+        """
+        key = self.key(file_id, metadata)
+        path = self.object_path(key)
+        with self._key_lock(key):
+            hit = os.path.exists(path)
+            if hit:
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # download_fn leaves partial data in <tmp_path>.part so a later run can resume
+                tmp_path = f"{path}.download"
+                download_fn(tmp_path)
+                os.replace(tmp_path, path)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            self._link(path, output_path)
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not hit:
+            self.evict()
+        return hit
+
+    def evict(self):
+        """
+        Remove least recently used unlinked objects until they fit in max_bytes.
+        The store is scanned every time (cheap next to a download), so objects
+        whose account files were removed in the meantime are counted too.
+        """
+        with self._lock:
+            entries, linked = [], 0
+            for entry in self._iter_objects():
+                stat = entry.stat()
+                if stat.st_nlink > 1:
+                    linked += stat.st_size
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            entries.sort(key=lambda item: item[0])
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError as e:
+                    print(f"⚠️ Failed to evict cached media {path}: {e}")
+        if removed:
+            print(f"🧹 Evicted {removed} cached media file(s), cache now {total / 1024 ** 3:.2f} GB "
+                  f"(plus {linked / 1024 ** 3:.2f} GB still linked from account folders)")
+        return removed
+
+    def print_summary(self):
+        own, linked = self.usage()
+        print(f"🗄️ Media cache: {self.hits} hit(s), {self.misses} download(s), "
+              f"{own / 1024 ** 3:.2f} GB of {self.max_bytes / 1024 ** 3:.2f} GB used "
+              f"(plus {linked / 1024 ** 3:.2f} GB still linked from account folders)")
@@ -0,0 +1,73 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AccountPipeline:
+    """
+    Run a fixed sequence of stages for many accounts, overlapping stages across
+    accounts. Each stage has its own bounded thread pool, so account N+1 can be
+    downloading while account N is being inserted or synced.
+
+    A stage is (name, fn, max_workers) where fn(account, value) receives the
+    previous stage's result (None for the first stage). Returning None, or
+    raising, stops the pipeline for that account and marks it failed.
+    """
+
+    def __init__(self, stages):
+        if not stages:
+            raise ValueError("AccountPipeline needs at least one stage")
+        self.stages = stages
+
+    def run_stream(self, items):
+        """
+        Process (account, value) pairs as they arrive from an iterable, passing
+        value to the first stage, and return {account: True/False} once the
+        iterable is exhausted and every account finished. An account that
+        appears more than once counts as successful if any of its runs was.
+        """
+        results = {}
+        executors = [
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+            for name, _, max_workers in self.stages
+        ]
+        cond = threading.Condition()
+        counts = {'submitted': 0, 'finished': 0}
+
+        def finish(account, ok):
+            with cond:
+                results[account] = results.get(account, False) or ok
+                counts['finished'] += 1
+                cond.notify_all()
+
+        def submit(stage_idx, account, value):
+            _, fn, _ = self.stages[stage_idx]
+            future = executors[stage_idx].submit(fn, account, value)
+            future.add_done_callback(lambda f: on_done(stage_idx, account, f))
+
+        def on_done(stage_idx, account, future):
+            name = self.stages[stage_idx][0]
+            try:
+                value = future.result()
+            except Exception as e:
+                print(f"❌ {name} failed for {account}: {e}")
+                print(traceback.format_exc())
+                value = None
+            if value is None:
+                finish(account, False)
+            elif stage_idx == len(self.stages) - 1:
+                finish(account, True)
+            else:
+                submit(stage_idx + 1, account, value)
+
+        try:
+            for account, value in items:
+                with cond:
+                    counts['submitted'] += 1
+                submit(0, account, value)
+            with cond:
+                cond.wait_for(lambda: counts['finished'] == counts['submitted'])
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+        return results
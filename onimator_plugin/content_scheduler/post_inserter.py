@@ -1,16 +1,34 @@
 import os
-import sqlite3
 import uuid
-import re
 import json
-from pyairtable import Api
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from pathlib import Path
 from dotenv import load_dotenv
-from .download_content import process_content_schedule, select_profile
+from common.discovery import device_index
+from common.paths import PLUGIN_DIR
+from common.sqlite_pool import is_locked_error, sqlite_pool
+from .caption_index import CaptionIndex, normalize_caption
+from .pipeline import AccountPipeline
+from .media_cache import MediaCache
+from .airtable_writeback import AirtableWriteback
+from .airtable_mirror import AirtableMirror, load_mirror_settings
+from .username_cache import username_cache
+from .duplicate_policy import DuplicatePolicy, ACTIONS, PROMPT, REPLACE, SKIP, SKIP_ACCOUNT
+from .download_content import (
+    process_content_schedule, iter_records_by_username, authenticate_google_drive, create_download_executor,
+    DownloadThrottle
+)
 
 BASE_DIR = "/home/zacm/onimator"
 SHARED_CONTENT_DIR = "/home/zacm/shared_content_scheduler"
+# Accounts whose downloads / Airtable updates may run at the same time
+PIPELINE_DOWNLOAD_WORKERS = 2
+PIPELINE_AIRTABLE_WORKERS = 1
+MEDIA_CACHE_DIR = os.path.join(SHARED_CONTENT_DIR, '.media_cache')
+DEFAULT_CACHE_MAX_GB = 50
+DUPLICATE_LOG_FILE = os.path.join(PLUGIN_DIR, 'logs', 'duplicate_decisions.log')
 
 WINDOWS_SHARED_PREFIX = r'C:\Users\Fredrick\shared_content_scheduler'
 LINUX_SHARED_PREFIX = '/home/zacm/shared_content_scheduler'
@@ -20,9 +38,180 @@ def convert_linux_to_windows_path(linux_path):
     windows_path = os.path.join(WINDOWS_SHARED_PREFIX, relative)
     return windows_path.replace('/', '\\')
 
+def convert_windows_to_linux_path(windows_path):
+    if not windows_path or not windows_path.startswith(WINDOWS_SHARED_PREFIX):
+        return windows_path
+    relative = windows_path[len(WINDOWS_SHARED_PREFIX):].lstrip('\\')
+    return os.path.join(LINUX_SHARED_PREFIX, *relative.split('\\'))
+
 def generate_unique_post_id():
     return str(uuid.uuid4())
 
+SQLITE_MAX_VARIABLES = 900
+
+INSERT_POST_QUERY = """
+INSERT INTO scheduled_post (
+    post_id, file_location, caption, post_music, 
+    post_type, post_location, scheduled_date, date, is_published
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def parse_scheduled_date(scheduled_date):
+    """Parse a scheduled date into Onimator's '%Y-%m-%d %H:%M' format, or return None."""
+    for fmt in ("%Y-%m-%d %H:%M", "%d/%m/%Y %H:%M"):
+        try:
+            return datetime.strptime(scheduled_date, fmt).strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            continue
+    return None
+
+def find_existing_captions(cursor, captions):
+    """
+    Look up already scheduled posts by caption using chunked IN (...) queries.
+    Returns a dict of {caption: (post_id, scheduled_date, file_location)}.
+    """
+    existing = {}
+    captions = list(dict.fromkeys(captions))
+    for i in range(0, len(captions), SQLITE_MAX_VARIABLES):
+        chunk = captions[i:i + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT post_id, scheduled_date, file_location, caption FROM scheduled_post WHERE caption IN ({placeholders})",
+            chunk
+        )
+        for post_id, scheduled_date, file_location, caption in cursor.fetchall():
+            existing.setdefault(caption, (post_id, scheduled_date, file_location))
+    return existing
+
+def open_caption_index(db_path, conn):
+    """Open and refresh the sidecar caption index, or return None if it is unusable."""
+    try:
+        index = CaptionIndex(db_path, pool=sqlite_pool)
+    except Exception as e:
+        print(f"⚠️ Caption index unavailable, falling back to table scan: {e}")
+        return None
+    try:
+        sqlite_pool.retry(db_path, lambda: index.refresh(conn))
+        return index
+    except Exception as e:
+        print(f"⚠️ Caption index unavailable, falling back to table scan: {e}")
+        index.close()
+        return None
+
+def insert_posts(db_path, posts, use_caption_index=False, dup_policy=None, account=None):
+    """
+    Insert all posts for one account's scheduled_post.db in a single transaction.
+
+    Each post is a dict with file_location, caption, post_music, post_type,
+    post_location, scheduled_date and optionally is_published. Duplicate captions
+    are resolved with one IN (...) lookup before anything is written, or through
+    the sidecar CaptionIndex when use_caption_index is set (captions then match
+    ignoring case and whitespace). dup_policy decides what happens to duplicates;
+    it defaults to asking on the console.
+
+    The connection comes from the shared SQLitePool; the write is retried while
+    Onimator holds the database locked. Errors (including a database that stays
+    locked) are raised, so the account is reported as failed instead of its
+    posts being dropped.
+    Returns a list of post_ids in input order (None for posts that were skipped),
+    and True as a second value if the rest of the account was skipped.
+    """
+    if dup_policy is None:
+        dup_policy = DuplicatePolicy()
+    post_ids = [None] * len(posts)
+    skip_all_duplicates = False
+    index = None
+    try:
+        with sqlite_pool.connection(db_path) as conn:
+            cursor = conn.cursor()
+            captions = [post.get('caption', '') for post in posts]
+            if use_caption_index:
+                index = open_caption_index(db_path, conn)
+            if index:
+                caption_key = normalize_caption
+                found = index.lookup(captions)
+            else:
+                caption_key = lambda caption: caption
+                found = sqlite_pool.retry(db_path, lambda: find_existing_captions(cursor, captions))
+            existing = {caption_key(caption): row for caption, row in found.items()}
+
+            current_date = datetime.now().strftime("%Y-%m-%d %H:%M")
+            pending = {}
+            deletes = []
+            for i, post in enumerate(posts):
+                if skip_all_duplicates:
+                    print("⏭️ Skipping due to 'skip all duplicates for this account' setting.")
+                    continue
+
+                caption = post.get('caption', '')
+                key = caption_key(caption)
+                if key in existing:
+                    action = dup_policy.decide(account, existing[key], post)
+                    existing_id = existing[key][0]
+                    if action == SKIP:
+                        if dup_policy.interactive:
+                            print("⏭️ Skipping post.")
+                        continue
+                    elif action == REPLACE:
+                        if dup_policy.interactive:
+                            print("♻️ Replacing existing post...")
+                        if existing_id in pending:
+                            post_ids[pending.pop(existing_id)[0]] = None
+                        else:
+                            deletes.append((existing_id,))
+                    elif action == SKIP_ACCOUNT:
+                        print("🚫 Skipping all future duplicates for this account.")
+                        skip_all_duplicates = True
+                        continue
+                    elif dup_policy.interactive:
+                        print("📌 Keeping both posts...")
+
+                formatted_scheduled_date = parse_scheduled_date(post['scheduled_date'])
+                if not formatted_scheduled_date:
+                    print(f"❌ Invalid date/time format: '{post['scheduled_date']}'")
+                    continue
+
+                post_id = generate_unique_post_id()
+                post_ids[i] = post_id
+                pending[post_id] = (i, (
+                    post_id, post['file_location'], caption, post.get('post_music', ''),
+                    post.get('post_type', 'reels'), post.get('post_location', ''),
+                    formatted_scheduled_date, current_date, post.get('is_published', 0)
+                ))
+                existing[key] = (post_id, formatted_scheduled_date, post['file_location'])
+
+            rows = [row for _, row in sorted(pending.values(), key=lambda item: item[0])]
+
+            def write(conn):
+                if deletes:
+                    conn.executemany("DELETE FROM scheduled_post WHERE post_id = ?", deletes)
+                if rows:
+                    conn.executemany(INSERT_POST_QUERY, rows)
+
+            if deletes or rows:
+                sqlite_pool.transaction(db_path, write)
+
+            if index:
+                try:
+                    index.remove([post_id for post_id, in deletes])
+                    index.refresh(conn)
+                except Exception as e:
+                    print(f"⚠️ Failed to update caption index: {e}")
+
+        for post_id, (i, row) in sorted(pending.items(), key=lambda item: item[1][0]):
+            print(f"✅ Inserted post: {post_id} at {row[6]}")
+        return post_ids, skip_all_duplicates
+
+    except Exception as e:
+        if is_locked_error(e):
+            print(f"❌ {db_path} stayed locked; {len(posts)} post(s) were not inserted: {e}")
+        else:
+            print(f"❌ Error inserting posts: {e}")
+        raise
+    finally:
+        if index:
+            index.close()
+
 def insert_post(
     db_path,
     file_location,
@@ -32,92 +221,32 @@ def insert_post(
     post_location,
     scheduled_date,
     is_published=0,
-    skip_all_duplicates=False
+    skip_all_duplicates=False,
+    dup_policy=None
 ):
-    try:
-        if skip_all_duplicates:
-            print("⏭️ Skipping due to 'skip all duplicates for this account' setting.")
-            return None
-
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Check for duplicate caption
-        cursor.execute("SELECT post_id, scheduled_date, file_location FROM scheduled_post WHERE caption = ?", (caption,))
-        existing = cursor.fetchone()
-
-        if existing:
-            existing_id, existing_date, existing_path = existing
-            print(f"\n⚠️ Duplicate caption detected:")
-            print(f"→ Existing Post ID: {existing_id}")
-            print(f"→ Scheduled for: {existing_date}")
-            print(f"→ File: {existing_path}")
-            print(f"→ Caption: {caption}")
-            print("Options: [y] replace  [s] skip  [n] keep both  [a] skip all for this account")
-
-            choice = input("Your choice: ").strip().lower()
-            if choice == 's':
-                print("⏭️ Skipping post.")
-                conn.close()
-                return None
-            elif choice == 'y':
-                print("♻️ Replacing existing post...")
-                cursor.execute("DELETE FROM scheduled_post WHERE post_id = ?", (existing_id,))
-            elif choice == 'a':
-                print("🚫 Skipping all future duplicates for this account.")
-                conn.close()
-                return 'SKIP_ALL_DUPES'
-            else:
-                print("📌 Keeping both posts...")
-
-        # Parse scheduled date
-        parsed_date = None
-        for fmt in ("%Y-%m-%d %H:%M", "%d/%m/%Y %H:%M"):
-            try:
-                parsed_date = datetime.strptime(scheduled_date, fmt)
-                break
-            except ValueError:
-                continue
-        if not parsed_date:
-            print(f"❌ Invalid date/time format: '{scheduled_date}'")
-            conn.close()
-            return None
-
-        formatted_scheduled_date = parsed_date.strftime("%Y-%m-%d %H:%M")
-        current_date = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-        # Generate post ID
-        post_id = generate_unique_post_id()
-
-        query = """
-        INSERT INTO scheduled_post (
-            post_id, file_location, caption, post_music, 
-            post_type, post_location, scheduled_date, date, is_published
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, (
-            post_id, file_location, caption, post_music, 
-            post_type, post_location, formatted_scheduled_date, current_date, is_published
-        ))
-
-        conn.commit()
-        conn.close()
-        print(f"✅ Inserted post: {post_id} at {formatted_scheduled_date}")
-        return post_id
+    if skip_all_duplicates:
+        print("⏭️ Skipping due to 'skip all duplicates for this account' setting.")
+        return None
 
-    except Exception as e:
-        print(f"❌ Error inserting post: {e}")
+    try:
+        post_ids, skip_all = insert_posts(db_path, dup_policy=dup_policy, posts=[{
+            'file_location': file_location,
+            'caption': caption,
+            'post_music': post_music,
+            'post_type': post_type,
+            'post_location': post_location,
+            'scheduled_date': scheduled_date,
+            'is_published': is_published,
+        }])
+    except Exception:
         return None
+    if skip_all:
+        return 'SKIP_ALL_DUPES'
+    return post_ids[0]
 
 def get_connected_devices():
     try:
-        device_pattern = re.compile(r'^[A-Z0-9]+$')  # Only capital letters and numbers
-        devices = [
-            folder for folder in os.listdir(BASE_DIR)
-            if os.path.isdir(os.path.join(BASE_DIR, folder))
-            and device_pattern.match(folder)
-            and len(folder) >= 10
-        ]
+        devices = device_index(BASE_DIR).devices()
         if not devices:
             print("❌ No valid Android devices found.")
         return devices
@@ -241,31 +370,546 @@ def select_accounts(device_accounts):
                     print(f"{idx}. {account}")
         return selected_accounts
 
-# New helper function for fetching valid usernames from the Active Accounts table:
-def get_valid_usernames_for_model(api_key, base_id, active_accounts_table_id, model_name):
+def fetch_valid_usernames(api_key, base_id, active_accounts_table_id, mirror_settings=None):
     """
-    Fetch the list of valid usernames for a given model from the 'Active Accounts' table.
-    Since the table only contains a 'Username' field, this function fetches all records.
-    Returns a set of usernames (strings).
+    Read every username in the Active Accounts table (it only has a 'Username'
+    field), through the Airtable mirror when it is enabled. Errors propagate.
     """
     from pyairtable import Api
+
+    settings = load_mirror_settings(mirror_settings)
+    if settings['enabled']:
+        try:
+            with AirtableMirror(base_id, active_accounts_table_id) as mirror:
+                mirror.sync(api_key, settings['full_resync_hours'])
+                return mirror.usernames()
+        except Exception as e:
+            print(f"⚠️ Airtable mirror unavailable, fetching the Active Accounts table directly: {e}")
+    table = Api(api_key).base(base_id).table(active_accounts_table_id)
+    valid_usernames = set()
+    for rec in table.all():
+        username = rec.get("fields", {}).get("Username")
+        if username:
+            valid_usernames.add(username.strip().lower())
+    return valid_usernames
+
+# New helper function for fetching valid usernames from the Active Accounts table:
+def get_valid_usernames_for_model(
+    api_key, base_id, active_accounts_table_id, model_name, mirror_settings=None, cache_settings=None, refresh=False
+):
+    """
+    Return the set of valid (lowercased) usernames for a given model from the
+    'Active Accounts' table. Results are cached in memory and on disk per table
+    (config.json "username_cache"); refresh=True always fetches a new list.
+    """
     try:
-        api = Api(api_key)
-        base = api.base(base_id)
-        table = base.table(active_accounts_table_id)
-        records = table.all()
-        valid_usernames = set()
-        for rec in records:
-            fields = rec.get("fields", {})
-            username = fields.get("Username")
-            if username:
-                valid_usernames.add(username.strip().lower())
-        return valid_usernames
+        return username_cache.get(
+            base_id, active_accounts_table_id,
+            lambda: fetch_valid_usernames(api_key, base_id, active_accounts_table_id, mirror_settings),
+            settings=cache_settings,
+            refresh=refresh
+        )
     except Exception as e:
         print(f"❌ Error fetching valid usernames for model '{model_name}': {e}")
         return set()
 
-def main():
+def select_duplicate_policy():
+    """Ask once, up front, how duplicate captions should be handled for this run."""
+    print("\n♻️ Duplicate caption handling:")
+    print("Press Enter to decide for each duplicate, or choose a policy for the whole run:")
+    for i, action in enumerate(ACTIONS, 1):
+        print(f"{i}. {action}")
+    choice = input("Your choice: ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(ACTIONS):
+        action = ACTIONS[int(choice) - 1]
+    else:
+        action = PROMPT
+
+    within_days = None
+    while True:
+        days = input("Only treat captions as duplicates within N days of each other "
+                     "(Press Enter for any date): ").strip()
+        if days == '':
+            break
+        if days.isdigit():
+            within_days = int(days)
+            break
+        print("Please enter a whole number of days.")
+    match_file_hash = input("Only treat captions as duplicates when the media files are identical? "
+                            "(type 'yes', or press Enter for no): ").strip().lower() in ('y', 'yes')
+
+    print(f"→ Duplicate policy: {action}"
+          + (f", within {within_days} day(s)" if within_days is not None else "")
+          + (", same media only" if match_file_hash else ""))
+    return DuplicatePolicy(
+        action, within_days=within_days, match_file_hash=match_file_hash, path_resolver=convert_windows_to_linux_path
+    )
+
+# Device sub-folders that are not accounts (besides hidden ones)
+EXCLUDED_ACCOUNT_FOLDERS = ['.stm', '.trash', 'trash', 'temp', 'temporary', 'camera', 'crash_log', 'log']
+
+def list_device_accounts(device):
+    """Return the account folders of a device. Raises FileNotFoundError if the device folder is missing."""
+    accounts = device_index(BASE_DIR).accounts(device, excluded=EXCLUDED_ACCOUNT_FOLDERS)
+    if accounts is None:
+        raise FileNotFoundError(f"Device folder not found: {os.path.join(BASE_DIR, device)}")
+    return accounts
+
+def open_schedule_mirror(airtable_pat, model_config, mirror_settings=None):
+    """Sync and return the model's schedule mirror, or None when disabled or the sync fails."""
+    settings = load_mirror_settings(mirror_settings)
+    if not settings['enabled']:
+        return None
+    mirror = None
+    try:
+        mirror = AirtableMirror(model_config['base_id'], model_config['table_id'], schedule_table=True)
+        mirror.sync(airtable_pat, settings['full_resync_hours'])
+        return mirror
+    except Exception as e:
+        print(f"⚠️ Airtable mirror unavailable, querying Airtable directly: {e}")
+        if mirror is not None:
+            mirror.close()
+        return None
+
+def schedule_device_accounts(
+    selected_device,
+    selected_model,
+    model_config,
+    selected_accounts,
+    airtable_pat,
+    dup_policy,
+    creds,
+    throttle,
+    drive_executor,
+    media_cache=None,
+    download_workers=PIPELINE_DOWNLOAD_WORKERS,
+    airtable_workers=PIPELINE_AIRTABLE_WORKERS,
+    writeback=None,
+    mirror=None,
+    use_caption_index=False,
+    schedule_records=None
+):
+    """
+    Schedule content for the selected accounts of one device.
+    Drive credentials, the download pool/throttle, the media cache and the
+    Airtable write-back queue are passed in so several devices can share them
+    (a private write-back queue is used when none is given). With a synced
+    AirtableMirror the schedule is read locally instead of from Airtable.
+    use_caption_index switches duplicate detection to the sidecar CaptionIndex.
+    schedule_records, an iterable of (username, records) such as the ones
+    share_schedule_records() hands out, replaces the per-device query.
+    Returns (success_accounts, failed_accounts, unchanged_accounts); unchanged
+    accounts had nothing new to schedule (no records, or only skipped duplicates).
+    """
+    own_writeback = writeback is None
+    if own_writeback:
+        writeback = AirtableWriteback(airtable_pat).start()
+
+    config = {
+        'airtable_pat': airtable_pat,
+        'base_id': model_config.get('base_id'),
+        'table_id': model_config.get('table_id'),
+        'view_id': model_config.get('view_id'),
+        'output_folder': os.path.join(SHARED_CONTENT_DIR, selected_model, "media"),
+    }
+
+    def download_stage(account, account_records):
+        print(f"\n📂 Processing account: {account}")
+
+        db_path = os.path.join(BASE_DIR, selected_device, account, "scheduled_post.db")
+        if not device_index(BASE_DIR).has_file(selected_device, account, "scheduled_post.db"):
+            print(f"❌ Database not found for {account}: {db_path}")
+            return None
+
+        content_data = process_content_schedule(
+            airtable_pat=config['airtable_pat'],
+            base_id=config['base_id'],
+            table_id=config['table_id'],
+            view_id=config['view_id'],
+            output_folder=config['output_folder'],
+            _=None,
+            profile=account,
+            device={'id': selected_device},
+            record_limit=None,
+            update_all=False,
+            records=account_records,
+            creds=creds,
+            executor=drive_executor,
+            media_cache=media_cache,
+            throttle=throttle
+        )
+
+        if not content_data:
+            print(f"⚠️ No content found for account: {account}")
+            return None
+        return db_path, content_data
+
+    unchanged = set()
+
+    def insert_stage(account, downloaded):
+        db_path, content_data = downloaded
+        posts = []
+        for post in content_data:
+            windows_file_path = convert_linux_to_windows_path(post.media_file_path)
+            try:
+                combined_dt = datetime.strptime(f"{post.schedule_date} {post.schedule_time}", "%d/%m/%Y %H:%M")
+            except ValueError:
+                print(f"❌ Invalid datetime: {post.schedule_date} {post.schedule_time}")
+                continue
+
+            posts.append({
+                'id': post.id,
+                'file_location': windows_file_path,
+                'caption': post.get('caption', ''),
+                'post_music': post.get('song', ''),
+                'post_type': post.get('post_type', 'reels'),
+                'post_location': post.get('post_location', ''),
+                'scheduled_date': combined_dt.strftime("%Y-%m-%d %H:%M"),
+                'airtable_scheduled_date': combined_dt.isoformat(),
+                'is_published': 0,
+            })
+
+        post_ids, _ = insert_posts(
+            db_path, posts, use_caption_index=use_caption_index, dup_policy=dup_policy, account=account
+        )
+        inserted_records = [
+            {
+                "id": post['id'],
+                "fields": {
+                    "post_id": post_id,
+                    "scheduled_date": post['airtable_scheduled_date']
+                }
+            }
+            for post, post_id in zip(posts, post_ids) if post_id
+        ]
+        if not inserted_records:
+            print(f"ℹ️ No new posts inserted for {account}, skipping Airtable update.")
+            if posts:
+                # Every post was an already scheduled duplicate: nothing to do, not a failure
+                unchanged.add(account)
+            return None
+        return inserted_records
+
+    def airtable_stage(account, inserted_records):
+        # Sent in the background, batched with other accounts' updates
+        writeback.submit(config['base_id'], config['table_id'], inserted_records)
+        print(f"📤 Queued {len(inserted_records)} Airtable update(s) for {account}")
+        print(f"✅ Done with account: {account}")
+        return True
+
+    # Inserts stay serial: they may prompt on the console and share one policy.
+    pipeline = AccountPipeline([
+        ('download', download_stage, download_workers),
+        ('insert', insert_stage, 1),
+        ('airtable', airtable_stage, airtable_workers),
+    ])
+
+    # Stream the model's schedule in one sorted, paginated query: each account
+    # enters the pipeline as soon as its records are complete.
+    accounts_by_username = {account.strip().lower(): account for account in selected_accounts}
+    fetch_errors = []
+
+    def stream_account_records():
+        if schedule_records is not None:
+            source = schedule_records
+        elif mirror is not None:
+            source = mirror.iter_records_by_username(accounts_by_username, view_id=config['view_id'])
+        else:
+            source = iter_records_by_username(
+                airtable_pat=config['airtable_pat'],
+                base_id=config['base_id'],
+                table_id=config['table_id'],
+                view_id=config['view_id']
+            )
+        try:
+            for username, records in source:
+                if username in accounts_by_username:
+                    yield accounts_by_username[username], records
+        except Exception as e:
+            print(f"❌ Error fetching records: {e}")
+            import traceback
+            print(traceback.format_exc())
+            fetch_errors.append(e)
+
+    try:
+        results = pipeline.run_stream(stream_account_records())
+    finally:
+        if own_writeback:
+            writeback.print_summary(writeback.close())
+    for account in selected_accounts:
+        if account not in results:
+            if fetch_errors:
+                print(f"❌ Schedule for {account} could not be fetched: {fetch_errors[0]}")
+            else:
+                print(f"ℹ️ Nothing scheduled in Airtable for account: {account}")
+                unchanged.add(account)
+    success_accounts = [account for account in selected_accounts if results.get(account)]
+    unchanged_accounts = [
+        account for account in selected_accounts if not results.get(account) and account in unchanged
+    ]
+    failed_accounts = [
+        account for account in selected_accounts if not results.get(account) and account not in unchanged
+    ]
+
+    return success_accounts, failed_accounts, unchanged_accounts
+
+def share_schedule_records(source, device_accounts):
+    """
+    Read one (username, records) stream, e.g. iter_records_by_username, on a
+    background thread and hand each username to the devices that have that
+    account, so a multi-device run queries the model's table once.
+    Returns {device: iterable}; an error from source is raised in every
+    device's iterable once its earlier items have been consumed.
+    """
+    done = object()
+    feeds = {device: queue.Queue() for device in device_accounts}
+    devices_by_username = {}
+    for device, accounts in device_accounts.items():
+        for account in accounts:
+            devices_by_username.setdefault(account.strip().lower(), []).append(device)
+
+    def produce():
+        try:
+            for username, records in source:
+                for device in devices_by_username.get(username, []):
+                    feeds[device].put((username, records))
+        except Exception as e:
+            for feed in feeds.values():
+                feed.put(e)
+        finally:
+            for feed in feeds.values():
+                feed.put(done)
+
+    def consume(feed):
+        while True:
+            item = feed.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    threading.Thread(target=produce, name='schedule-records', daemon=True).start()
+    return {device: consume(feed) for device, feed in feeds.items()}
+
+def print_schedule_summary(success_accounts, failed_accounts, unchanged_accounts=()):
+    print("\n📊 Update Summary:")
+    print(f"✅ Successful accounts: {len(success_accounts)}")
+    if success_accounts:
+        print("   → " + ", ".join(success_accounts))
+    if unchanged_accounts:
+        print(f"➖ Nothing new to schedule: {len(unchanged_accounts)}")
+        print("   → " + ", ".join(unchanged_accounts))
+    print(f"❌ Failed accounts: {len(failed_accounts)}")
+    if failed_accounts:
+        print("   → " + ", ".join(failed_accounts))
+
+def run_schedule(
+    device_accounts,
+    selected_model,
+    model_config,
+    airtable_pat,
+    dup_policy,
+    download_settings=None,
+    cache_max_gb=DEFAULT_CACHE_MAX_GB,
+    parallel=1,
+    download_workers=PIPELINE_DOWNLOAD_WORKERS,
+    airtable_workers=PIPELINE_AIRTABLE_WORKERS,
+    mirror_settings=None,
+    use_caption_index=False
+):
+    """
+    Schedule content for {device: [accounts]}, running up to `parallel` devices
+    at once. Drive auth, the download pool, the media cache, the Airtable
+    mirror (config.json "airtable_mirror") or else a single query of the
+    model's table are shared by every device in the run. Returns a list of per-device result dicts.
+    """
+    # Authenticate Drive once for all accounts; the schedule is streamed per device.
+    print("\n🔐 Authenticating with Google Drive...")
+    creds = authenticate_google_drive()
+    # One Drive pool for the whole run so each worker's client is reused across accounts
+    throttle = DownloadThrottle(download_settings)
+    drive_executor = create_download_executor(throttle.max_workers)
+    media_cache = None
+    if cache_max_gb and cache_max_gb > 0:
+        media_cache = MediaCache(MEDIA_CACHE_DIR, max_bytes=int(cache_max_gb * 1024 ** 3))
+    # Airtable updates from every device are batched together and sent in the background
+    writeback = AirtableWriteback(airtable_pat).start()
+    mirror = open_schedule_mirror(airtable_pat, model_config, mirror_settings)
+    # Without a mirror the model's table is queried once and shared by every device
+    schedule_records = {}
+    if mirror is None:
+        schedule_records = share_schedule_records(
+            iter_records_by_username(
+                airtable_pat=airtable_pat,
+                base_id=model_config.get('base_id'),
+                table_id=model_config.get('table_id'),
+                view_id=model_config.get('view_id')
+            ),
+            device_accounts
+        )
+
+    def run_device(device):
+        try:
+            success, failed, unchanged = schedule_device_accounts(
+                device, selected_model, model_config, device_accounts[device], airtable_pat, dup_policy,
+                creds, throttle, drive_executor, media_cache,
+                download_workers=download_workers, airtable_workers=airtable_workers, writeback=writeback,
+                mirror=mirror, use_caption_index=use_caption_index, schedule_records=schedule_records.get(device)
+            )
+            return {'device': device, 'success': success, 'failed': failed, 'unchanged': unchanged}
+        except Exception as e:
+            print(f"❌ Error scheduling device {device}: {e}")
+            return {
+                'device': device, 'success': [], 'failed': list(device_accounts[device]), 'unchanged': [],
+                'error': str(e)
+            }
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, parallel), thread_name_prefix='device') as pool:
+            results = list(pool.map(run_device, list(device_accounts)))
+    finally:
+        drive_executor.shutdown(wait=True)
+        print("\n📤 Sending remaining Airtable updates...")
+        unsent = writeback.close()
+        if mirror is not None:
+            mirror.close()
+
+    print("\n✨ Processing complete!")
+    for result in results:
+        if len(results) > 1:
+            print(f"\n📱 Device: {result['device']}")
+        print_schedule_summary(result['success'], result['failed'], result['unchanged'])
+
+    device_index(BASE_DIR).save()
+    throttle.print_summary()
+    writeback.print_summary(unsent)
+    sqlite_pool.print_summary()
+    sqlite_pool.close_all()
+    dup_policy.print_summary()
+    if media_cache is not None:
+        # Account files removed during the run may have left objects only the cache holds
+        media_cache.evict()
+        media_cache.print_summary()
+    dup_policy.write_log(DUPLICATE_LOG_FILE)
+    return results
+
+def select_model_accounts_for_devices(
+    devices, model_name, model_config, airtable_pat, accounts='all', mirror_settings=None, cache_settings=None,
+    refresh=False
+):
+    """
+    Resolve the accounts to schedule on each device: device folders that are
+    active accounts for the model, optionally limited to `accounts` (a list of
+    usernames, or 'all'). Returns ({device: [accounts]}, {device: error}).
+    """
+    valid_usernames = get_valid_usernames_for_model(
+        api_key=airtable_pat,
+        base_id=model_config['base_id'],
+        active_accounts_table_id=model_config.get('active_accounts_table_id'),
+        model_name=model_name,
+        mirror_settings=mirror_settings,
+        cache_settings=cache_settings,
+        refresh=refresh
+    )
+    wanted = None if accounts == 'all' else {account.strip().lower() for account in accounts}
+
+    device_accounts, errors = {}, {}
+    for device in devices:
+        try:
+            matching = sorted(
+                (acc for acc in list_device_accounts(device)
+                 if acc.strip().lower() in valid_usernames
+                 and (wanted is None or acc.strip().lower() in wanted)),
+                key=lambda x: x.lower()
+            )
+        except OSError as e:
+            errors[device] = str(e)
+            continue
+        if matching:
+            device_accounts[device] = matching
+        else:
+            errors[device] = "No valid accounts found on the device for this model"
+    return device_accounts, errors
+
+def schedule_batch(
+    model_name,
+    devices='all',
+    accounts='all',
+    dup_action='skip',
+    parallel=1,
+    cache_max_gb=DEFAULT_CACHE_MAX_GB,
+    refresh=False,
+    use_caption_index=False,
+    dup_within_days=None,
+    dup_match_hash=False
+):
+    """
+    Non-interactive scheduling entry point used by the batch CLI. dup_within_days
+    and dup_match_hash narrow what counts as a duplicate (see DuplicatePolicy). refresh
+    bypasses the cached Active Accounts list; use_caption_index matches
+    duplicate captions through the sidecar index (ignoring case and whitespace). Returns a JSON-serialisable summary.
+    """
+    load_dotenv()
+    summary = {'model': model_name, 'devices': [], 'errors': {}}
+
+    airtable_pat = os.getenv('AIRTABLE_PAT')
+    config_data = load_config()
+    if not airtable_pat:
+        summary['errors']['_'] = "Missing AIRTABLE_PAT in .env file"
+        return summary
+    if not config_data or model_name not in config_data.get('creators', {}):
+        summary['errors']['_'] = f"Model '{model_name}' not found in config.json"
+        return summary
+    model_config = config_data['creators'][model_name]
+    if not model_config.get('active_accounts_table_id'):
+        summary['errors']['_'] = "No 'active_accounts_table_id' found in config for this model."
+        return summary
+
+    connected = get_connected_devices()
+    if devices == 'all':
+        devices = connected
+    else:
+        for device in devices:
+            if device not in connected:
+                summary['errors'][device] = "Device not found"
+        devices = [device for device in devices if device in connected]
+
+    device_accounts, errors = select_model_accounts_for_devices(
+        devices, model_name, model_config, airtable_pat, accounts,
+        mirror_settings=config_data.get('airtable_mirror'),
+        cache_settings=config_data.get('username_cache'),
+        refresh=refresh
+    )
+    summary['errors'].update(errors)
+    if not device_accounts:
+        return summary
+
+    dup_policy = DuplicatePolicy(
+        dup_action, within_days=dup_within_days, match_file_hash=dup_match_hash,
+        path_resolver=convert_windows_to_linux_path
+    )
+    summary['devices'] = run_schedule(
+        device_accounts, model_name, model_config, airtable_pat, dup_policy,
+        download_settings=config_data.get('download'),
+        cache_max_gb=cache_max_gb,
+        parallel=parallel,
+        mirror_settings=config_data.get('airtable_mirror'),
+        use_caption_index=use_caption_index
+    )
+    summary['duplicates'] = {
+        action: sum(1 for d in dup_policy.decisions if d['action'] == action) for action in ACTIONS
+    }
+    return summary
+
+def main(
+    dup_policy=None,
+    download_workers=PIPELINE_DOWNLOAD_WORKERS,
+    airtable_workers=PIPELINE_AIRTABLE_WORKERS,
+    cache_max_gb=DEFAULT_CACHE_MAX_GB,
+    refresh=False,
+    use_caption_index=False
+):
     load_dotenv()
     print("\n📱 Instagram Post Scheduler")
     print("=" * 50)
@@ -312,15 +956,9 @@ def main():
     model_config = config_data['creators'][selected_model]
     print(f"\n→ Selected model: {selected_model}")
 
-    device_path = os.path.join(BASE_DIR, selected_device)
     print(f"→ Checking accounts in device: {selected_device}")
 
-    device_accounts = [
-        folder for folder in os.listdir(device_path)
-        if os.path.isdir(os.path.join(device_path, folder))
-        and not folder.startswith('.')
-        and folder.lower() not in ['.stm', '.trash', 'trash', 'temp', 'temporary', 'camera', 'crash_log', 'log']
-    ]
+    device_accounts = list_device_accounts(selected_device)
 
     if not device_accounts:
         print("❌ No accounts found in device folder.")
@@ -336,7 +974,10 @@ def main():
         api_key=airtable_pat,
         base_id=model_config['base_id'],
         active_accounts_table_id=active_accounts_table_id,
-        model_name=selected_model
+        model_name=selected_model,
+        mirror_settings=config_data.get('airtable_mirror'),
+        cache_settings=config_data.get('username_cache'),
+        refresh=refresh
     )
 
     # Filter device accounts to only those matching valid usernames (case-insensitive).
@@ -352,105 +993,18 @@ def main():
     selected_accounts = select_accounts(filtered_device_accounts)
     print(f"\n✅ Final selected accounts: {', '.join(selected_accounts)}")
 
-    success_accounts = []
-    failed_accounts = []
-
-    for account in selected_accounts:
-        print(f"\n📂 Processing account: {account}")
-        skip_all_for_this_account = False
-
-        config = {
-            'airtable_pat': airtable_pat,
-            'base_id': model_config.get('base_id'),
-            'table_id': model_config.get('table_id'),
-            'view_id': model_config.get('view_id'),
-            'output_folder': os.path.join(SHARED_CONTENT_DIR, selected_model, "media"),
-        }
-
-        db_path = os.path.join(BASE_DIR, selected_device, account, "scheduled_post.db")
-        if not os.path.exists(db_path):
-            print(f"❌ Database not found for {account}: {db_path}")
-            failed_accounts.append(account)
-            continue
-
-        content_data = process_content_schedule(
-            airtable_pat=config['airtable_pat'],
-            base_id=config['base_id'],
-            table_id=config['table_id'],
-            view_id=config['view_id'],
-            output_folder=config['output_folder'],
-            _=None,
-            profile=account,
-            device={'id': selected_device},
-            record_limit=None,
-            update_all=False
-        )
-
-        if content_data is None or content_data.empty:
-            print(f"⚠️ No content found for account: {account}")
-            failed_accounts.append(account)
-            continue
-
-        inserted_records = []
-        for _, post in content_data.iterrows():
-            windows_file_path = convert_linux_to_windows_path(post['media_file_path'])
-            try:
-                combined_dt = datetime.strptime(f"{post['schedule_date']} {post['schedule_time']}", "%d/%m/%Y %H:%M")
-                scheduled_datetime = combined_dt.strftime("%Y-%m-%d %H:%M")
-                airtable_scheduled_datetime = combined_dt.isoformat()
-            except ValueError:
-                print(f"❌ Invalid datetime: {post['schedule_date']} {post['schedule_time']}")
-                continue
-
-            post_id = insert_post(
-                db_path=db_path,
-                file_location=windows_file_path,
-                caption=post.get('caption', ''),
-                post_music=post.get('song', ''),
-                post_type=post.get('post_type', 'reels'),
-                post_location=post.get('post_location', ''),
-                scheduled_date=scheduled_datetime,
-                is_published=0,
-                skip_all_duplicates=skip_all_for_this_account
-            )
-
-            if post_id == 'SKIP_ALL_DUPES':
-                skip_all_for_this_account = True
-                continue
-            if post_id:
-                inserted_records.append({
-                    "id": post.get('id'),
-                    "fields": {
-                        "post_id": post_id,
-                        "scheduled_date": airtable_scheduled_datetime
-                    }
-                })
-
-        if inserted_records:
-            table = Api(airtable_pat).base(model_config['base_id']).table(model_config['table_id'])
-            print(f"🔄 Updating Airtable for {len(inserted_records)} posts...")
-            for i in range(0, len(inserted_records), 10):
-                batch = inserted_records[i:i+10]
-                try:
-                    table.batch_update(batch)
-                    print(f"✅ Updated batch of {len(batch)} records")
-                except Exception as e:
-                    print(f"❌ Batch update failed: {e}")
-            success_accounts.append(account)
-        else:
-            print(f"ℹ️ No new posts inserted for {account}, skipping Airtable update.")
-            failed_accounts.append(account)
-
-        print(f"✅ Done with account: {account}")
-
-    print("\n✨ Processing complete!")
-    print("\n📊 Update Summary:")
-    print(f"✅ Successful accounts: {len(success_accounts)}")
-    if success_accounts:
-        print("   → " + ", ".join(success_accounts))
-    print(f"❌ Failed accounts: {len(failed_accounts)}")
-    if failed_accounts:
-        print("   → " + ", ".join(failed_accounts))
+    if dup_policy is None:
+        dup_policy = select_duplicate_policy()
+
+    run_schedule(
+        {selected_device: selected_accounts}, selected_model, model_config, airtable_pat, dup_policy,
+        download_settings=config_data.get('download'),
+        cache_max_gb=cache_max_gb,
+        download_workers=download_workers,
+        airtable_workers=airtable_workers,
+        mirror_settings=config_data.get('airtable_mirror'),
+        use_caption_index=use_caption_index
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,50 @@
+def normalize_field_name(name):
+    """Airtable field name -> attribute name, e.g. 'Schedule Time (24h)' -> 'schedule_time'."""
+    return name.lower().replace(' (24h)', '').replace(' ', '_')
+
+
+class ContentRecord:
+    """
+    One scheduled post flowing from Airtable through download and insert.
+
+    Known fields are exposed as attributes under their normalized names; the
+    raw Airtable fields dict is kept as-is (not copied) in `fields`, and any
+    other normalized fields are available through get().
+    """
+
+    __slots__ = (
+        'id', 'username', 'caption', 'schedule_date', 'schedule_time', 'song',
+        'post_type', 'post_location', 'media_file_path', 'device_id', 'fields',
+    )
+
+    def __init__(self, record_id, fields, device_id=None):
+        self.id = record_id
+        self.fields = fields
+        self.device_id = device_id
+        self.username = None
+        self.caption = None
+        self.schedule_date = None
+        self.schedule_time = None
+        self.song = None
+        self.post_type = None
+        self.post_location = None
+        self.media_file_path = None
+        for name, value in fields.items():
+            attr = normalize_field_name(name)
+            if attr in self.__slots__ and attr not in ('id', 'fields', 'device_id'):
+                setattr(self, attr, value)
+        if self.username is None:
+            self.username = 'unknown'
+
+    def get(self, name, default=None):
+        """Dict-style access by normalized field name, like the old DataFrame rows."""
+        if name in self.__slots__:
+            value = getattr(self, name)
+        else:
+            value = next(
+                (v for k, v in self.fields.items() if normalize_field_name(k) == name), None
+            )
+        return default if value is None else value
+
+    def __repr__(self):
+        return f"ContentRecord(id={self.id!r}, username={self.username!r}, schedule_date={self.schedule_date!r})"
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import atexit
+import threading
+from common.atomic import atomic_write_lines
+from common.paths import cache_path
+
+DEFAULT_USERNAME_CACHE_SETTINGS = {
+    # Served without contacting Airtable while younger than this
+    'ttl_minutes': 60,
+    # Older entries up to this age are served at once and refreshed in the background
+    'stale_minutes': 24 * 60,
+}
+# How long a one-shot run waits at exit for background refreshes to finish
+REFRESH_EXIT_TIMEOUT = 30
+
+
+def load_username_cache_settings(settings=None):
+    """config.json "username_cache" merged over DEFAULT_USERNAME_CACHE_SETTINGS."""
+    return {**DEFAULT_USERNAME_CACHE_SETTINGS, **(settings or {})}
+
+
+class UsernameCache:
+    """
+    Valid-username sets per (base_id, active_accounts_table_id), kept in memory
+    for the life of the process and as JSON files in the plugin cache.
+
+    get() returns a fresh entry directly. A stale entry is returned at once and
+    refreshed by a background thread (stale-while-revalidate); entries older
+    than stale_minutes, or any entry when refresh=True, are fetched before
+    returning. If a fetch fails, whatever is cached is served instead.
+    Background refreshes are waited for at exit (see wait()), so a short CLI
+    run still renews the entry it served stale.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._refreshing = set()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path(base_id, table_id):
+        return cache_path('valid_usernames', f"{base_id}_{table_id}.json")
+
+    def _load(self, key):
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+        path = self.path(*key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as file:
+                data = json.load(file)
+            entry = (data['fetched_at'], frozenset(data['usernames']))
+        except (OSError, ValueError, KeyError):
+            return None
+        with self._lock:
+            return self._entries.setdefault(key, entry)
+
+    def _store(self, key, usernames):
+        entry = (time.time(), frozenset(usernames))
+        with self._lock:
+            self._entries[key] = entry
+        atomic_write_lines(self.path(*key), [json.dumps({'fetched_at': entry[0], 'usernames': sorted(entry[1])})])
+        return entry[1]
+
+    def _revalidate(self, key, fetch):
+        def run():
+            try:
+                self._store(key, fetch())
+            except Exception as e:
+                print(f"⚠️ Background refresh of the Active Accounts list failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        thread = threading.Thread(target=run, name='username-refresh', daemon=True)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._threads = [t for t in self._threads if t.is_alive()] + [thread]
+        thread.start()
+
+    def wait(self, timeout=REFRESH_EXIT_TIMEOUT):
+        """Wait up to timeout seconds (in total) for background refreshes to finish."""
+        with self._lock:
+            threads = [thread for thread in self._threads if thread.is_alive()]
+        if not threads:
+            return
+        print("⏳ Finishing the background refresh of the Active Accounts list...")
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+    def get(self, base_id, table_id, fetch, settings=None, refresh=False):
+        """Return the cached set for the table, calling fetch() (which may raise) when needed."""
+        settings = load_username_cache_settings(settings)
+        key = (base_id, table_id)
+        entry = None if refresh else self._load(key)
+        if entry is not None:
+            fetched_at, usernames = entry
+            age = time.time() - fetched_at
+            if age < settings['ttl_minutes'] * 60:
+                return set(usernames)
+            if age < settings['stale_minutes'] * 60:
+                self._revalidate(key, fetch)
+                return set(usernames)
+        try:
+            return set(self._store(key, fetch()))
+        except Exception:
+            entry = entry or self._load(key)
+            if entry is None:
+                raise
+            print(f"⚠️ Using the cached Active Accounts list from {time.ctime(entry[0])}")
+            return set(entry[1])
+
+
+# Shared by every caller in the process so repeat lookups never leave memory
+username_cache = UsernameCache()
+atexit.register(username_cache.wait)
@@ -0,0 +1,63 @@
+from collections import deque
+
+
+class ExclusionMatcher:
+    """
+    Aho-Corasick automaton over lowercased exclusion substrings (the contents
+    of exclude_names.txt). A name is excluded when any pattern occurs anywhere
+    in it, the same rule Onimator applies to name_must_not_include.txt, but
+    checked once here in a single pass per name instead of on every device.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = sorted({pattern.strip().lower() for pattern in patterns if pattern.strip()})
+        # State 0 is the root; each state has its transitions, a failure link
+        # and whether some pattern ends at it (directly or via its failure chain)
+        self._goto = [{}]
+        self._fail = [0]
+        self._terminal = [False]
+        for pattern in self.patterns:
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._terminal.append(False)
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._terminal[state] = True
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._terminal[next_state] = self._terminal[next_state] or self._terminal[self._fail[next_state]]
+                queue.append(next_state)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def matches(self, name):
+        """True if any exclusion pattern occurs in name (case-insensitive)."""
+        goto, fail, terminal = self._goto, self._fail, self._terminal
+        state = 0
+        for char in name.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if terminal[state]:
+                return True
+        return False
+
+    def split(self, names):
+        """Return (kept, excluded), both in input order."""
+        kept, excluded = [], []
+        for name in names:
+            (excluded if self.matches(name) else kept).append(name)
+        return kept, excluded
@@ -0,0 +1,76 @@
+import re
+import logging
+
+# Instagram usernames: 1-30 of a-z, 0-9, '.' and '_', no leading, trailing or doubled dots
+USERNAME_PATTERN = re.compile(r'^(?!\.)(?!.*\.\.)(?!.*\.$)[a-z0-9._]{1,30}$')
+# Profile links, with or without scheme/www, optionally followed by more path or a query string
+PROFILE_URL_PATTERN = re.compile(
+    r'^(?:https?://)?(?:www\.|m\.)?instagram\.com/([^/?#\s]*)(?:/([^/?#\s]*))?', re.IGNORECASE
+)
+# Link prefixes whose second path segment is the username (stories/<user>/<id>, _u/<user>)
+USER_PREFIX_SEGMENTS = {'stories', '_u'}
+# First path segments of links that are not profiles (posts, reels, pages of the site)
+RESERVED_SEGMENTS = {
+    'p', 'reel', 'reels', 'tv', 'explore', 'accounts', 'direct', 'about', 'legal', 'developer',
+    'web', 'emails', 'challenge', 'graphql', 'api', 'oauth', 'privacy', 'session', 'lite', 'directory',
+}
+
+# Byte-order marks and zero-width characters picked up from copy/paste
+INVISIBLE_CHARACTERS = '\ufeff\u200b\u200c\u200d\u2060'
+
+REJECTED_REPORT_LIMIT = 20
+
+
+def normalize_username(line):
+    """
+    Normalize one raw line to a lowercase username.
+    Returns (username, None) or (None, reason) when the line is rejected.
+    """
+    name = line.strip().strip(INVISIBLE_CHARACTERS).strip()
+    if not name:
+        return None, "blank"
+    match = PROFILE_URL_PATTERN.match(name)
+    if match:
+        name = match.group(1)
+        if name.lower() in USER_PREFIX_SEGMENTS:
+            name = match.group(2) or ''
+        elif name.lower() in RESERVED_SEGMENTS:
+            return None, "not a profile link"
+    name = name.lstrip('@').lower()
+    if not USERNAME_PATTERN.match(name):
+        return None, "invalid username"
+    return name, None
+
+
+def normalize_usernames(lines):
+    """
+    Normalize and de-duplicate (case-insensitively) a list of raw lines.
+    Returns (usernames, rejected): usernames keep first-seen order and rejected
+    is a list of (line_number, line, reason). Blank lines are dropped silently.
+    """
+    usernames = []
+    seen = set()
+    rejected = []
+    for line_number, line in enumerate(lines, start=1):
+        name, reason = normalize_username(line)
+        if name is None:
+            if reason != "blank":
+                rejected.append((line_number, line.strip(), reason))
+        elif name not in seen:
+            seen.add(name)
+            usernames.append(name)
+    return usernames, rejected
+
+
+def report_rejected(rejected, source, limit=REJECTED_REPORT_LIMIT):
+    """Print and log the lines normalize_usernames rejected from source."""
+    if not rejected:
+        return
+    print(f"⚠️ Skipped {len(rejected)} invalid line(s) in {source}:")
+    for line_number, line, reason in rejected[:limit]:
+        print(f"   → line {line_number}: {line!r} ({reason})")
+    if len(rejected) > limit:
+        print(f"   → ... and {len(rejected) - limit} more (see log)")
+    logging.warning(f"Rejected {len(rejected)} line(s) in {source}")
+    for line_number, line, reason in rejected:
+        logging.warning(f"{source}:{line_number}: {line!r} ({reason})")
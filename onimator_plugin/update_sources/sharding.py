@@ -0,0 +1,112 @@
+import os
+import json
+import heapq
+import hashlib
+import logging
+from common.atomic import atomic_write_lines
+from common.paths import cache_path
+
+# How new names are spread over the selected models
+ROUND_ROBIN = 'round-robin'
+HASH = 'hash'
+WEIGHTED = 'weighted'
+STRATEGIES = (ROUND_ROBIN, HASH, WEIGHTED)
+
+
+def rendezvous_score(name, model):
+    """Highest-random-weight score: every model ranks every name independently."""
+    return hashlib.sha1(f"{model}\0{name}".encode('utf-8')).digest()
+
+
+def shard_index_path(target_file, models):
+    """One index per target file and set of models, so runs over other models never share slots."""
+    key = hashlib.sha1('\n'.join(sorted(models)).encode('utf-8')).hexdigest()[:16]
+    return cache_path('shards', f"{target_file}.{key}.json")
+
+
+class ShardIndex:
+    """
+    Name -> [model] assignments, persisted as JSON when a path is given (see
+    shard_index_path). Keeping earlier assignments makes re-runs stable: a name
+    already placed is never moved, so only new names and slots freed by deleted
+    models are assigned.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.assignments = {}
+        self.cursor = 0
+        if path and os.path.exists(path):
+            try:
+                with open(self.path, 'r') as file:
+                    data = json.load(file)
+                self.assignments = data.get('assignments', {})
+                self.cursor = data.get('cursor', 0)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable shard index {self.path}: {e}")
+                print(f"⚠️ Shard index {self.path} is unreadable, starting a new one")
+
+    def prune(self, keep):
+        """Drop assignments to models for which keep(model) is False (e.g. deleted folders)."""
+        dropped = 0
+        for name, models in self.assignments.items():
+            kept = [model for model in models if keep(model)]
+            if len(kept) != len(models):
+                dropped += len(models) - len(kept)
+                self.assignments[name] = kept
+        if dropped:
+            logging.info(f"Shard index {self.path}: released {dropped} assignment(s) to missing models")
+        return dropped
+
+    def save(self):
+        if self.path:
+            atomic_write_lines(
+                self.path, [json.dumps({'cursor': self.cursor, 'assignments': self.assignments})]
+            )
+
+
+def assign_shards(names, models, k=1, strategy=HASH, sizes=None, index=None):
+    """
+    Assign each name to at most k models. Returns {model: [names]} for the
+    given models only.
+
+    Existing assignments in index to these models count towards k, so a name
+    is never spread over more than k of them across runs; assignments to other
+    models are dropped. Free slots are filled by strategy:
+      round-robin  next model in turn (the turn is kept in the index)
+      hash         rendezvous hashing; stable even without an index
+      weighted     the model with the fewest entries, counting `sizes`
+                   (each model's current list length) plus this run's names
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown shard strategy: {strategy}")
+    index = index if index is not None else ShardIndex()
+    models = list(models)
+    result = {model: [] for model in models}
+    if not models:
+        return result
+    order = {model: position for position, model in enumerate(models)}
+    load = {model: (sizes or {}).get(model, 0) for model in models}
+    k = max(1, min(k, len(models)))
+
+    for name in names:
+        assigned = [model for model in index.assignments.get(name, []) if model in order]
+        need = k - len(assigned)
+        if need > 0:
+            candidates = [model for model in models if model not in assigned]
+            if strategy == HASH:
+                picked = heapq.nlargest(need, candidates, key=lambda model: rendezvous_score(name, model))
+            elif strategy == WEIGHTED:
+                picked = heapq.nsmallest(need, candidates, key=lambda model: (load[model], order[model]))
+            else:
+                start = index.cursor % len(models)
+                rotation = models[start:] + models[:start]
+                picked = [model for model in rotation if model not in assigned][:need]
+                index.cursor = start + 1
+            assigned.extend(picked)
+            index.assignments[name] = assigned
+        for model in assigned:
+            if model in result:
+                result[model].append(name)
+                load[model] += 1
+    return result
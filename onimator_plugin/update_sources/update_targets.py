@@ -2,15 +2,36 @@
 import os
 import sys
 import logging
-import re
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from common.atomic import atomic_write_lines
+from common.discovery import device_index
+from update_sources.exclusion import ExclusionMatcher
+from update_sources.normalize import normalize_usernames, report_rejected
+from update_sources.sharding import STRATEGIES, ShardIndex, assign_shards, shard_index_path
 
 # Define the base directory where your devices are stored on Linux
 BASE_DIR = "/home/zacm/onimator"  # adjust as necessary
 
-def read_usernames_from_file(file_path):
+# Selecting this updates every connected device
+ALL_DEVICES = 'all'
+# Number of target files written at the same time when updating several devices
+UPDATE_WORKERS = 8
+
+def read_usernames_from_file(file_path, normalize=False):
+    """
+    Read one name per line. With normalize, lines are lowercased, stripped of
+    '@' and profile URLs, validated and de-duplicated; rejected lines are
+    reported. Exclusion lists hold substrings, not usernames, so they are read raw.
+    """
     try:
         with open(file_path, 'r') as file:
             usernames = file.readlines()
+        if normalize:
+            usernames, rejected = normalize_usernames(usernames)
+            report_rejected(rejected, file_path)
+            return usernames
         return [username.strip() for username in usernames]
     except Exception as e:
         logging.error(f"Error reading file {file_path}: {e}")
@@ -36,14 +57,7 @@ def setup_environment():
 
 def get_connected_devices():
     try:
-        # Pattern: device IDs contain only uppercase letters and numbers
-        device_pattern = re.compile(r'^[A-Z0-9]+$')
-        devices = [
-            folder for folder in os.listdir(BASE_DIR)
-            if os.path.isdir(os.path.join(BASE_DIR, folder))
-            and device_pattern.match(folder)
-            and len(folder) >= 10  # typical device IDs are at least 10 characters
-        ]
+        devices = device_index(BASE_DIR).devices()
         if not devices:
             print("No valid Android devices found.")
             logging.warning("No valid Android devices found in the directory.")
@@ -53,37 +67,140 @@ def get_connected_devices():
         print(f"Error getting connected devices: {e}")
         return []
 
-def update_txt_file(file_path, content_list):
+class SourceList:
+    """
+    A source list parsed once and shared by every model file it is merged into:
+    the stripped, de-duplicated names as a sorted tuple plus a frozenset, so each
+    per-model merge is a linear walk rather than a fresh set and sort.
+    """
+
+    __slots__ = ('names', 'name_set')
+
+    def __init__(self, usernames):
+        self.name_set = frozenset(name for name in (item.strip() for item in usernames) if name)
+        self.names = tuple(sorted(self.name_set))
+
+    @classmethod
+    def freeze(cls, usernames):
+        return usernames if isinstance(usernames, cls) else cls(usernames)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def missing_from(self, sorted_entries):
+        """
+        Names not present in sorted_entries (sorted and unique), in order. Counting
+        hits against the frozenset first makes the common no-op case cost one pass
+        over the model's file only.
+        """
+        if sum(1 for entry in sorted_entries if entry in self.name_set) == len(self.names):
+            return []
+        missing = []
+        entries = iter(sorted_entries)
+        entry = next(entries, None)
+        for name in self.names:
+            while entry is not None and entry < name:
+                entry = next(entries, None)
+            if name != entry:
+                missing.append(name)
+        return missing
+
+def read_target_file(file_path):
+    """
+    Read a target file and report whether it is already in canonical form:
+    one stripped, non-empty name per line, strictly sorted, newline-terminated.
+    Returns (entries, is_canonical); entries are sorted and unique either way.
+    """
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return [], True
+    with open(file_path, 'r', newline='') as file:
+        text = file.read()
+    lines = text.split('\n')
+    is_canonical = text.endswith('\n')
+    if is_canonical:
+        lines.pop()
+        previous = None
+        for line in lines:
+            if not line or line != line.strip() or (previous is not None and line <= previous):
+                is_canonical = False
+                break
+            previous = line
+    if is_canonical:
+        return lines, True
+    return sorted({line.strip() for line in lines if line.strip()}), False
+
+def update_txt_file(file_path, content_list, incremental=True, keep_backup=False, normalize=False):
+    """
+    Merge content_list (a SourceList, or any iterable of names) into a sorted,
+    de-duplicated target file.
+
+    In incremental mode a file that is already canonical (see read_target_file)
+    is not re-sorted: nothing is written when there are no new names, new names
+    that all sort after the last line are appended, and anything else is
+    merge-inserted in one linear pass. The resulting file is identical to a
+    full sort-and-rewrite either way.
+
+    Every write, appends included, is atomic (temp file, fsync, os.replace), so
+    Onimator never reads a truncated list or half a name; keep_backup leaves the
+    previous version as <file>.bak.
+
+    With normalize, the file's existing lines are normalized as well (see
+    update_sources.normalize); invalid or non-normalized entries force a rewrite.
+
+    Errors are logged and re-raised, so callers can report the file as failed.
+    """
     try:
-        # Read existing content if file exists
-        existing_content = set()
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-            with open(file_path, 'r') as file:
-                existing_content = {line.strip() for line in file if line.strip()}
-        new_content = set(content_list)
-        combined_content = existing_content.union(new_content)
-        with open(file_path, 'w') as file:
-            for item in sorted(combined_content):
-                file.write(item + '\n')
-        new_entries = len(combined_content) - len(existing_content)
-        print(f"Updated file at {file_path}")
-        print(f"- Previous entries: {len(existing_content)}")
+        existing_entries, is_canonical = read_target_file(file_path)
+        if normalize:
+            normalized, rejected = normalize_usernames(existing_entries)
+            report_rejected(rejected, file_path)
+            normalized.sort()
+            if normalized != existing_entries:
+                existing_entries, is_canonical = normalized, False
+            if not isinstance(content_list, SourceList):
+                content_list = normalize_usernames(content_list)[0]
+        new_entries_sorted = SourceList.freeze(content_list).missing_from(existing_entries)
+        total = len(existing_entries) + len(new_entries_sorted)
+
+        if incremental and is_canonical:
+            if not new_entries_sorted:
+                mode = "unchanged"
+            elif not existing_entries or new_entries_sorted[0] > existing_entries[-1]:
+                mode = "appended"
+                atomic_write_lines(file_path, itertools.chain(existing_entries, new_entries_sorted), keep_backup)
+            else:
+                mode = "merged"
+                atomic_write_lines(file_path, heapq.merge(existing_entries, new_entries_sorted), keep_backup)
+        else:
+            mode = "rewritten"
+            atomic_write_lines(file_path, heapq.merge(existing_entries, new_entries_sorted), keep_backup)
+
+        new_entries = len(new_entries_sorted)
+        print(f"Updated file at {file_path}" if mode != "unchanged" else f"No new entries for {file_path}, left unchanged")
+        print(f"- Previous entries: {len(existing_entries)}")
         print(f"- New entries added: {new_entries}")
-        print(f"- Total entries now: {len(combined_content)}")
-        logging.info(f"File update: {file_path} - Previous: {len(existing_content)}, Added: {new_entries}, Total: {len(combined_content)}")
+        print(f"- Total entries now: {total}")
+        logging.info(f"File update ({mode}): {file_path} - Previous: {len(existing_entries)}, Added: {new_entries}, Total: {total}")
     except Exception as e:
         logging.error(f"Error updating file {file_path}: {e}")
-        print(f"Error updating file {file_path}: {e}")
+        raise
 
-def select_device(devices):
+def select_device(devices, allow_all=False):
     if not devices:
         print("Error: No connected devices found.")
         return None
     print("Available devices:")
+    if allow_all:
+        print(f"0. All devices ({len(devices)})")
     for i, device in enumerate(devices, start=1):
         print(f"{i}. {device}")
     try:
         device_index = int(input("Enter the number of the device you want to select: ")) - 1
+        if allow_all and device_index == -1:
+            return ALL_DEVICES
         if 0 <= device_index < len(devices):
             return devices[device_index]
         else:
@@ -93,19 +210,18 @@ def select_device(devices):
         print("Please enter a valid number.")
         return None
 
+def list_device_models(device_folder):
+    """Return the model (account) folders of a device, or None if the device folder is missing."""
+    return device_index(BASE_DIR).accounts(device_folder)
+
 def select_model_accounts(device_folder):
     # Build the path based on the Linux BASE_DIR
     base_path = os.path.join(BASE_DIR, device_folder)
-    if not os.path.exists(base_path):
+    models = list_device_models(device_folder)
+    if models is None:
         print(f"Error: Device folder not found: {base_path}")
         return []  # return empty list if not found
 
-    models = [
-        folder for folder in os.listdir(base_path)
-        if os.path.isdir(os.path.join(base_path, folder))
-        and not folder.startswith('.')  # skip hidden folders
-        and folder.lower() not in ['.stm', '.trash', 'trash', 'temp', 'temporary']
-    ]
     if not models:
         print("Error: No valid models found in the selected device folder.")
         return None
@@ -176,45 +292,262 @@ def select_file_type():
         else:
             print("Invalid selection. Please try again.")
 
-def write_usernames_to_file(device_folder, models, usernames, target_file):
-    try:
-        print(f"\nPreparing to update {target_file} for {len(models)} models in device {device_folder}")
-        print(f"Will add {len(usernames)} usernames to each model's file")
-        response = input("\nDo you want to proceed? (Press Enter for yes, or type 'no'): ").strip().lower()
-        if response == 'no':
-            print("Operation cancelled by user")
-            logging.info("File update operation cancelled by user")
-            return False
+def select_shard_strategy():
+    """Ask whether to split the sources across models. Returns (strategy or None, k)."""
+    print("\nHow should the usernames be shared between the selected models?")
+    print("1. Same list for every model (default)")
+    print("2. Split round-robin")
+    print("3. Split by hash (stable per username)")
+    print("4. Split weighted towards models with shorter lists")
+    choices = {'2': 'round-robin', '3': 'hash', '4': 'weighted'}
+    while True:
+        response = input("\nEnter your choice (Press Enter for option 1, or type '2', '3' or '4'): ").strip()
+        if response in ('', '1'):
+            return None, 1
+        if response in choices:
+            strategy = choices[response]
+            break
+        print("Invalid selection. Please try again.")
+    while True:
+        response = input("Maximum number of models per username (Press Enter for 1): ").strip()
+        if response == '':
+            return strategy, 1
+        if response.isdigit() and int(response) >= 1:
+            return strategy, int(response)
+        print("Please enter a whole number of 1 or more.")
+
+EXCLUSION_TARGETS = ['name_must_not_include.txt', 'name_must_not_include_likes.txt']
+
+def find_usernames_file(target_file, source=None):
+    """
+    Locate the usernames file to push into target_file. `source` may be a path
+    or a file name; by default exclude_names.txt is used for the exclusion
+    targets and follow_sources(.txt) otherwise. Returns None if nothing is found.
+    """
+    if source and (os.path.isabs(source) or os.path.exists(source)):
+        return os.path.abspath(source) if os.path.exists(source) else None
+    if source:
+        possible_filenames = [source]
+    elif target_file in EXCLUSION_TARGETS:
+        possible_filenames = ['exclude_names.txt']
+    else:
+        possible_filenames = ['follow_sources', 'follow_sources.txt']
+
+    # Search for the usernames file in a few potential directories
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    search_dirs = [
+        base_dir,
+        os.path.dirname(base_dir),
+        os.path.join(base_dir, 'data'),
+    ]
+    usernames_file = None
+    for directory in search_dirs:
+        for filename in possible_filenames:
+            temp_path = os.path.join(directory, filename)
+            if os.path.exists(temp_path):
+                usernames_file = temp_path
+    return usernames_file
+
+def update_model_file(base_path, model, usernames, target_file, keep_backup=False):
+    """Merge usernames into one model's target file. Raises if the model folder is missing."""
+    model_folder = os.path.join(base_path, model)
+    if not os.path.exists(model_folder):
+        logging.error(f"Model folder not found: {model_folder}")
+        raise FileNotFoundError("Model folder not found")
+
+    file_path = os.path.join(model_folder, target_file)
+    if not os.path.exists(file_path):
+        logging.info(f"Creating new file: {file_path}")
+        open(file_path, 'w').close()
+    update_txt_file(file_path, usernames, keep_backup=keep_backup, normalize=target_file not in EXCLUSION_TARGETS)
+    return os.path.relpath(file_path, base_path)
 
+def count_entries(file_path):
+    """Number of non-empty lines in a target file (0 if it doesn't exist)."""
+    if not os.path.exists(file_path):
+        return 0
+    with open(file_path, 'r') as file:
+        return sum(1 for line in file if line.strip())
+
+def shard_usernames(tasks, usernames, target_file, strategy, k=1):
+    """
+    Split usernames over the (device, base_path, model) tasks so each name goes
+    to at most k models (see update_sources.sharding). Assignments are kept in
+    the plugin cache per target file and set of models, so re-runs over the
+    same models only place new names.
+    Returns {(device, model): SourceList}.
+    """
+    keys = [f"{device_folder}/{model}" for device_folder, _, model in tasks]
+    sizes = None
+    if strategy == 'weighted':
+        sizes = {key: count_entries(os.path.join(BASE_DIR, key, target_file)) for key in keys}
+    index = ShardIndex(shard_index_path(target_file, keys))
+    # Release names held by model folders that no longer exist (one listing per device)
+    existing_models = {}
+    def model_exists(key):
+        device_folder, model = key.split('/', 1)
+        if device_folder not in existing_models:
+            existing_models[device_folder] = set(device_index(BASE_DIR).accounts(device_folder) or [])
+        return model in existing_models[device_folder]
+    index.prune(model_exists)
+    shards = assign_shards(usernames, keys, k=k, strategy=strategy, sizes=sizes, index=index)
+    index.save()
+    print(f"\nSharding {len(usernames)} usernames over {len(keys)} models ({strategy}, at most {k} per name):")
+    for key in keys:
+        print(f"   → {key}: {len(shards[key])}")
+    logging.info(f"Sharded {len(usernames)} usernames over {len(keys)} models for {target_file} ({strategy}, k={k})")
+    return {tuple(key.split('/', 1)): SourceList(names) for key, names in shards.items()}
+
+def load_exclusions():
+    """Compile exclude_names.txt into an ExclusionMatcher, or None if it can't be found."""
+    exclusions_file = find_usernames_file(EXCLUSION_TARGETS[0])
+    if not exclusions_file:
+        logging.warning("exclude_names.txt not found; sources will not be prefiltered")
+        print("⚠️ exclude_names.txt not found; sources will not be prefiltered")
+        return None
+    matcher = ExclusionMatcher(read_usernames_from_file(exclusions_file))
+    logging.info(f"Loaded {len(matcher)} exclusion patterns from {exclusions_file}")
+    return matcher
+
+def update_devices(
+    device_models, usernames, target_file, max_workers=UPDATE_WORKERS, keep_backup=False,
+    shard_strategy=None, shard_k=1, exclusions=None
+):
+    """
+    Merge usernames into target_file for every model in {device: [models]},
+    writing up to max_workers files at once. Never prompts.
+    With shard_strategy (one of update_sources.sharding.STRATEGIES) each model
+    gets only its share of the names, at most shard_k models per name.
+    exclusions (see load_exclusions) prefilters the names before they are
+    sharded; it is ignored for the exclusion lists themselves.
+    Returns a list of {'device', 'target_file', 'updated': [models], 'failed': {model: error}}.
+    """
+    usernames = SourceList.freeze(usernames)
+    results = {}
+    tasks = []
+    for device_folder, models in device_models.items():
+        results[device_folder] = {'device': device_folder, 'target_file': target_file, 'updated': [], 'failed': {}}
         logging.info(f"Starting to write usernames for {len(models)} models in device {device_folder} to {target_file}")
         base_path = os.path.join(BASE_DIR, device_folder)
         if not os.path.exists(base_path):
             error_msg = f"Device folder not found: {base_path}"
             logging.error(error_msg)
             print(f"\nError: {error_msg}")
+            results[device_folder]['failed'] = {model: error_msg for model in models}
+            continue
+        tasks.extend((device_folder, base_path, model) for model in models)
+
+    if exclusions is not None and target_file not in EXCLUSION_TARGETS:
+        kept, excluded = exclusions.split(usernames.names)
+        if excluded:
+            usernames = SourceList(kept)
+            print(f"Excluded by exclude_names.txt: {len(excluded)} username(s)")
+            logging.info(f"Excluded {len(excluded)} usernames matching exclude_names.txt")
+    shards = None
+    if shard_strategy and target_file in EXCLUSION_TARGETS:
+        print(f"⚠️ {target_file} is an exclusion list; writing it to every model without sharding")
+    elif shard_strategy:
+        shards = shard_usernames(
+            [task for task in tasks if task[2] in (device_index(BASE_DIR).accounts(task[0]) or [])],
+            usernames, target_file, shard_strategy, shard_k
+        )
+
+    def run_task(task):
+        device_folder, base_path, model = task
+        model_usernames = usernames if shards is None else shards.get((device_folder, model), SourceList(()))
+        try:
+            display_path = update_model_file(base_path, model, model_usernames, target_file, keep_backup)
+            print(f"✓ Successfully updated {device_folder}/{display_path}" if len(device_models) > 1
+                  else f"✓ Successfully updated {display_path}")
+            return None
+        except FileNotFoundError as e:
+            print(f"⨯ Error: Model folder not found for {model}")
+            return str(e)
+        except Exception as e:
+            logging.error(f"Error processing model {model}: {str(e)}")
+            print(f"⨯ Error processing {model}: {str(e)}")
+            return str(e)
+
+    print("\nUpdating files...")
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for (device_folder, _, model), error in zip(tasks, pool.map(run_task, tasks)):
+            if error is None:
+                results[device_folder]['updated'].append(model)
+            else:
+                results[device_folder]['failed'][model] = error
+    device_index(BASE_DIR).save()
+    return [results[device_folder] for device_folder in device_models]
+
+def update_model_files(device_folder, models, usernames, target_file, shard_strategy=None, shard_k=1, exclusions=None):
+    """Merge usernames into target_file for each model of one device, without prompting."""
+    return update_devices(
+        {device_folder: models}, usernames, target_file, max_workers=1, shard_strategy=shard_strategy, shard_k=shard_k,
+        exclusions=exclusions
+    )[0]
+
+def print_update_summary(results):
+    """Print one aggregated summary for a multi-device update."""
+    updated = sum(len(result['updated']) for result in results)
+    failed = sum(len(result['failed']) for result in results)
+    print("\nOperation Summary:")
+    print(f"✓ Successfully updated: {updated} models across {len(results)} devices")
+    if failed:
+        print(f"⨯ Failed to update: {failed} models")
+        for result in results:
+            for model, error in result['failed'].items():
+                print(f"   → {result['device']}/{model}: {error}")
+    logging.info(f"Multi-device update: {updated} updated, {failed} failed across {len(results)} devices")
+    if not failed:
+        print("\nAll files were updated successfully!")
+    elif updated:
+        print("\nSome files were updated, but there were errors.")
+        print("Check the log file for details.")
+    else:
+        print("\nNo files were updated successfully.")
+        print("Check the log file for details.")
+
+def write_usernames_to_devices(
+    device_models, usernames, target_file, confirm=True, max_workers=UPDATE_WORKERS, shard_strategy=None, shard_k=1,
+    exclusions=None
+):
+    """Interactive wrapper around update_devices for the 'All devices' menu option."""
+    total = sum(len(models) for models in device_models.values())
+    print(f"\nPreparing to update {target_file} for {total} models across {len(device_models)} devices")
+    if shard_strategy:
+        print(f"Will split {len(usernames)} usernames across the models ({shard_strategy}, at most {shard_k} per name)")
+    else:
+        print(f"Will add {len(usernames)} usernames to each model's file")
+    if confirm:
+        response = input("\nDo you want to proceed? (Press Enter for yes, or type 'no'): ").strip().lower()
+        if response == 'no':
+            print("Operation cancelled by user")
+            logging.info("File update operation cancelled by user")
             return False
+    results = update_devices(
+        device_models, usernames, target_file, max_workers=max_workers, shard_strategy=shard_strategy, shard_k=shard_k,
+        exclusions=exclusions
+    )
+    print_update_summary(results)
+    return any(result['updated'] for result in results)
 
-        success_count = 0
-        print("\nUpdating files...")
-        for model in models:
-            try:
-                model_folder = os.path.join(base_path, model)
-                if not os.path.exists(model_folder):
-                    logging.error(f"Model folder not found: {model_folder}")
-                    print(f"⨯ Error: Model folder not found for {model}")
-                    continue
+def write_usernames_to_file(
+    device_folder, models, usernames, target_file, confirm=True, shard_strategy=None, shard_k=1, exclusions=None
+):
+    try:
+        print(f"\nPreparing to update {target_file} for {len(models)} models in device {device_folder}")
+        if shard_strategy:
+            print(f"Will split {len(usernames)} usernames across the models ({shard_strategy}, at most {shard_k} per name)")
+        else:
+            print(f"Will add {len(usernames)} usernames to each model's file")
+        if confirm:
+            response = input("\nDo you want to proceed? (Press Enter for yes, or type 'no'): ").strip().lower()
+            if response == 'no':
+                print("Operation cancelled by user")
+                logging.info("File update operation cancelled by user")
+                return False
 
-                file_path = os.path.join(model_folder, target_file)
-                display_path = os.path.relpath(file_path, base_path)
-                if not os.path.exists(file_path):
-                    logging.info(f"Creating new file: {file_path}")
-                    open(file_path, 'w').close()
-                update_txt_file(file_path, usernames)
-                print(f"✓ Successfully updated {display_path}")
-                success_count += 1
-            except Exception as e:
-                logging.error(f"Error processing model {model}: {str(e)}")
-                print(f"⨯ Error processing {model}: {str(e)}")
+        result = update_model_files(device_folder, models, usernames, target_file, shard_strategy, shard_k, exclusions)
+        success_count = len(result['updated'])
 
         print("\nOperation Summary:")
         print(f"✓ Successfully updated: {success_count} models")
@@ -235,6 +568,65 @@ def write_usernames_to_file(device_folder, models, usernames, target_file):
         print("Check the log file for details.")
         return False
 
+def run_update(
+    devices, models, target_file='like-source-followers.txt', source=None, max_workers=UPDATE_WORKERS,
+    keep_backup=False, shard_strategy=None, shard_k=1, exclude=False
+):
+    """
+    Non-interactive update used by the batch CLI. `devices` is a device name, a
+    list of names or 'all' (every connected device); `models` is a list of model
+    folder names or 'all'. shard_strategy/shard_k split the names across the
+    models and exclude prefilters them against exclude_names.txt (see
+    update_devices). Returns an aggregated, JSON-serialisable summary.
+    """
+    if shard_strategy and shard_strategy not in STRATEGIES:
+        raise ValueError(f"Unknown shard strategy: {shard_strategy}")
+    setup_environment()
+    summary = {'target_file': target_file, 'devices': [], 'errors': {}}
+    usernames_file = find_usernames_file(target_file, source)
+    if not usernames_file:
+        logging.error(f"Username file not found for {target_file} (source: {source})")
+        summary['errors']['_'] = "Username file not found"
+        return summary
+
+    if devices == ALL_DEVICES:
+        devices = get_connected_devices()
+    elif isinstance(devices, str):
+        devices = [devices]
+
+    device_models = {}
+    for device_folder in devices:
+        available_models = list_device_models(device_folder)
+        if available_models is None:
+            summary['errors'][device_folder] = "Device folder not found"
+            continue
+        if models == 'all':
+            device_models[device_folder] = available_models
+        else:
+            missing = [model for model in models if model not in available_models]
+            if missing:
+                logging.warning(f"Unknown models on device {device_folder}: {', '.join(missing)}")
+            device_models[device_folder] = [model for model in models if model in available_models]
+
+    usernames = SourceList(read_usernames_from_file(usernames_file, normalize=target_file not in EXCLUSION_TARGETS))
+    if not usernames:
+        summary['errors']['_'] = "No usernames found in the usernames file"
+        return summary
+
+    logging.info(f"Processing {len(usernames)} usernames for {sum(len(m) for m in device_models.values())} models")
+    summary['usernames_file'] = usernames_file
+    summary['usernames'] = len(usernames)
+    if shard_strategy:
+        summary['shard'] = {'strategy': shard_strategy, 'k': shard_k}
+    exclusions = load_exclusions() if exclude and target_file not in EXCLUSION_TARGETS else None
+    summary['devices'] = update_devices(
+        device_models, usernames, target_file, max_workers=max_workers, keep_backup=keep_backup,
+        shard_strategy=shard_strategy, shard_k=shard_k, exclusions=exclusions
+    )
+    if len(summary['devices']) > 1:
+        print_update_summary(summary['devices'])
+    return summary
+
 def main():
     try:
         logs_dir = setup_environment()
@@ -252,7 +644,7 @@ def main():
                 else:
                     continue
 
-            selected_device = select_device(devices)
+            selected_device = select_device(devices, allow_all=True)
             if not selected_device:
                 logging.error("No device selected by user")
                 print("No device selected.")
@@ -266,7 +658,12 @@ def main():
             target_file = select_file_type()
             logging.info(f"Selected file type: {target_file}")
 
-            selected_models = select_model_accounts(selected_device)
+            if selected_device == ALL_DEVICES:
+                device_models = {device: list_device_models(device) or [] for device in devices}
+                selected_models = [model for models in device_models.values() for model in models]
+                print(f"\nSelected all models on {len(devices)} devices ({len(selected_models)} models)")
+            else:
+                selected_models = select_model_accounts(selected_device)
             if not selected_models:
                 logging.error("No models selected by user")
                 print("No models selected.")
@@ -278,30 +675,14 @@ def main():
                     continue
 
             # Determine which usernames file to use based on target file type
-            if target_file in ['name_must_not_include.txt', 'name_must_not_include_likes.txt']:
-                possible_filenames = ['exclude_names.txt']
-            else:
-                possible_filenames = ['follow_sources', 'follow_sources.txt']
-
-            # Search for the usernames file in a few potential directories
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            search_dirs = [
-                base_dir,
-                os.path.dirname(base_dir),
-                os.path.join(base_dir, 'data'),
-            ]
-            usernames_file = None
-            for directory in search_dirs:
-                for filename in possible_filenames:
-                    temp_path = os.path.join(directory, filename)
-                    if os.path.exists(temp_path):
-                        usernames_file = temp_path
+            usernames_file = find_usernames_file(target_file)
             if not usernames_file:
-                if target_file in ['name_must_not_include.txt', 'name_must_not_include_likes.txt']:
+                if target_file in EXCLUSION_TARGETS:
                     print("\nError: exclude_names.txt file not found!")
                     print("Please ensure exclude_names.txt exists in the project directory.")
                     logging.error("exclude_names.txt file not found")
                 else:
+                    possible_filenames = ['follow_sources', 'follow_sources.txt']
                     print("\nError: Username file not found!")
                     print("Expected filenames:", possible_filenames)
                     print("\nPlease ensure one of these files exists in the project directory.")
@@ -314,7 +695,9 @@ def main():
                     continue
 
             print(f"Reading usernames from: {usernames_file}")
-            usernames = read_usernames_from_file(usernames_file)
+            usernames = SourceList(
+                read_usernames_from_file(usernames_file, normalize=target_file not in EXCLUSION_TARGETS)
+            )
             if not usernames:
                 logging.error("No usernames found in the usernames file")
                 print("No usernames found in the usernames file.")
@@ -327,7 +710,24 @@ def main():
 
             print(f"Found {len(usernames)} usernames to process")
             logging.info(f"Processing {len(usernames)} usernames for {len(selected_models)} models")
-            success = write_usernames_to_file(selected_device, selected_models, usernames, target_file)
+            shard_strategy, shard_k = None, 1
+            exclusions = None
+            if target_file not in EXCLUSION_TARGETS:
+                if len(selected_models) > 1:
+                    shard_strategy, shard_k = select_shard_strategy()
+                response = input("\nSkip usernames matching exclude_names.txt? (Press Enter for no, or type 'yes'): ")
+                if response.strip().lower() in ('y', 'yes'):
+                    exclusions = load_exclusions()
+            if selected_device == ALL_DEVICES:
+                success = write_usernames_to_devices(
+                    device_models, usernames, target_file, shard_strategy=shard_strategy, shard_k=shard_k,
+                    exclusions=exclusions
+                )
+            else:
+                success = write_usernames_to_file(
+                    selected_device, selected_models, usernames, target_file,
+                    shard_strategy=shard_strategy, shard_k=shard_k, exclusions=exclusions
+                )
             if success:
                 logging.info("Successfully completed all operations")
                 print("\nAll operations completed successfully!")